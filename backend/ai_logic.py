@@ -1,6 +1,11 @@
 import sys
 import os
-import json
+import string
+import asyncio
+import threading
+from collections import OrderedDict
+
+import orjson
 
 # --- Import AI/LLM libraries ---
 try:
@@ -10,6 +15,18 @@ except ImportError:
     print("Please install it using: pip install google-generativeai")
     sys.exit(1)
 
+# Queries are encoded like the chunks they are compared against: same model,
+# inference_mode and (with EMBEDDING_BF16=1) bf16 autocast
+from data_fetcher import encode_texts
+
+# --- Optional: ONNX runtime for the request-gating classifier ---
+try:
+    import numpy as np
+    import onnxruntime as ort
+except ImportError:
+    np = None
+    ort = None
+
 # --- !! IMPORTANT !! ---
 # Load API key from environment variable (set in Render)
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
@@ -21,14 +38,10 @@ model = None
 try:
     if GEMINI_API_KEY:
         genai.configure(api_key=GEMINI_API_KEY)
-        # Try multiple model names for better compatibility
         try:
-            model = genai.GenerativeModel('gemini-1.5-flash')  # Newer, faster model
-        except:
-            try:
-                model = genai.GenerativeModel('gemini-1.0-pro')  # Fallback to original
-            except Exception as e:
-                print(f"Error initializing Gemini model: {e}")
+            model = genai.GenerativeModel('gemini-1.5-flash')
+        except Exception as e:
+            print(f"Error initializing Gemini model: {e}")
     else:
         print("Warning: GEMINI_API_KEY is not set in environment.")
         
@@ -37,71 +50,182 @@ except Exception as e:
 
 # --- 1. RAG Retrieval ---
 
-def retrieve_relevant_chunks(query, vector_index, text_chunks, metadata, k=5):
+class _BoundedCache:
+    """Small thread-safe LRU mapping used for the retrieval caches below."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# The RAG query is deterministic per ticker, so both its embedding and the
+# FAISS result for a given corpus can be reused. Search results are keyed on
+# the caller's content key (ticker + data_fetcher.content_hash()): the same
+# news and summary always produce the same index, whether it was rebuilt or
+# served from the index caches.
+_query_embedding_cache = _BoundedCache(maxsize=1024)
+_search_cache = _BoundedCache(maxsize=1024)
+
+def _encode_queries(queries):
+    """
+    Encodes a list of query strings in a single model call. Embeddings are
+    unit-normalized to match the inner-product indices.
+    """
+    return encode_texts(
+        queries, batch_size=len(queries), convert_to_numpy=True,
+        normalize_embeddings=True
+    )
+
+class EmbeddingBatcher:
+    """
+    Groups query embeddings from concurrent requests into one encode() call.
+    Each caller awaits submit(); a single worker drains the queue for up to
+    max_wait_ms (or max_batch items) and encodes the whole batch at once.
+    """
+
+    def __init__(self, max_batch=32, max_wait_ms=5):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        """Starts the worker task. Must be called from a running event loop."""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, query):
+        """Returns the 1xD embedding for a query."""
+        cached = _query_embedding_cache.get(query)
+        if cached is not None:
+            return cached
+        if self._worker is None:
+            # Batcher not running (e.g. outside the server): encode directly
+            embedding = await asyncio.to_thread(_encode_queries, [query])
+            _query_embedding_cache.put(query, embedding)
+            return embedding
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            queries = [query for query, _ in batch]
+            try:
+                embeddings = await asyncio.to_thread(_encode_queries, queries)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for i, (query, future) in enumerate(batch):
+                embedding = embeddings[i:i + 1]
+                _query_embedding_cache.put(query, embedding)
+                if not future.done():
+                    future.set_result(embedding)
+
+# Shared batcher, started from the FastAPI lifespan handler
+embedding_batcher = EmbeddingBatcher()
+
+def retrieve_relevant_chunks(query, vector_index, text_chunks, metadata, k=5, query_embedding=None,
+                             content_key=None):
     """
     Searches the FAISS index for the top-k most relevant text chunks.
+    Pass query_embedding to skip encoding the query here (e.g. when it was
+    already encoded through the EmbeddingBatcher), and content_key to
+    reuse search results for the same indexed content.
     """
     if vector_index is None:
         print("Vector index is not available.")
         return [], []
     
+    search_key = (content_key, query, k) if content_key is not None else None
+    search_result = _search_cache.get(search_key) if search_key is not None else None
+    
     # 1. Embed the query
-    try:
-        from data_fetcher import embedding_model
-        if embedding_model is None:
-            print("Error: Embedding model not loaded from data_fetcher.")
-            return [], []
-        query_embedding = embedding_model.encode([query])
-    except Exception as e:
-        print(f"Error encoding query: {e}")
-        return [], []
+    if search_result is None and query_embedding is None:
+        query_embedding = _query_embedding_cache.get(query)
+        if query_embedding is None:
+            try:
+                query_embedding = _encode_queries([query])
+            except Exception as e:
+                print(f"Error encoding query: {e}")
+                return [], []
+            _query_embedding_cache.put(query, query_embedding)
 
     # 2. Search the FAISS index
-    try:
-        D, I = vector_index.search(query_embedding, k)
-    except Exception as e:
-        print(f"Error searching FAISS index: {e}")
-        return [], []
+    if search_result is None:
+        try:
+            search_result = vector_index.search(query_embedding, k)
+        except Exception as e:
+            print(f"Error searching FAISS index: {e}")
+            return [], []
+        if search_key is not None:
+            _search_cache.put(search_key, search_result)
+    D, I = search_result
 
     # 3. Format the results
-    relevant_chunks = []
-    citations = set()  # Use a set to avoid duplicate citations
-    
-    for i, chunk_index in enumerate(I[0]):
-        if chunk_index < 0 or chunk_index >= len(text_chunks):
-            continue
-            
-        chunk = text_chunks[chunk_index]
-        meta = metadata[chunk_index]
-        
-        # Use .get() to provide default values
-        source_name = meta.get('source', 'Unknown Source')
-        source_url = meta.get('url', '#')
-        source_date = meta.get('date', 'N/A')
-        
-        citation_str = f"[{source_name}]({source_url}) - {source_date}"
-        
-        relevant_chunks.append(f"Source: {citation_str}\nContent: {chunk}")
-        citations.add(citation_str)
+    # Citation strings are precomputed per chunk in process_and_embed()
+    text_chunks_len = len(text_chunks)
+    hits = [j for j in I[0].tolist() if 0 <= j < text_chunks_len]  # -1 marks a missing hit
+    relevant_chunks = [
+        f"Source: {metadata[j]['citation']}\nContent: {text_chunks[j]}" for j in hits
+    ]
+    citations = list(dict.fromkeys(metadata[j]['citation'] for j in hits))  # unique, in rank order
 
-    return relevant_chunks, list(citations)
+    return relevant_chunks, citations
 
 # --- 2. Prompt Engineering (UPDATED) ---
 
-def build_prompt(ticker, fundamentals, relevant_chunks, citations, user_profile):
-    """
-    Builds the final prompt string to send to the LLM.
-    """
-    
-    # --- System Prompt: The AI's "Instructions" ---
-    system_prompt = """
+# --- System Prompt: The AI's "Instructions" ---
+# Compiled once at import; build_prompt() only substitutes the $placeholders.
+SYSTEM_PROMPT_TEMPLATE = string.Template("""
 You are an expert financial analyst and portfolio manager. Your task is to provide a comprehensive, data-driven analysis for a *specific user* based on their profile and the provided data.
 
 **USER PROFILE:**
-- **Financial Condition:** {user_profile_financialCondition}
-- **Risk Tolerance:** {user_profile_riskTolerance}
-- **Expected Return %:** {user_profile_expectedReturn}%
-- **Trading Preferences:** {user_profile_tradingPreferences}
+- **Financial Condition:** $financialCondition
+- **Risk Tolerance:** $riskTolerance
+- **Expected Return %:** $expectedReturn%
+- **Trading Preferences:** $tradingPreferences
 
 **YOUR TASK:**
 Analyze the provided stock data and generate a personalized report. The user is asking for:
@@ -115,41 +239,62 @@ Analyze the provided stock data and generate a personalized report. The user is
 4.  The output must be formatted *exactly* as a single JSON object. Do not include markdown formatting (```json) or any text outside the curly braces.
 
 **REQUIRED JSON OUTPUT FORMAT:**
-{{
+{
   "analysis": "Detailed analysis text here...",
   "keyNews": "Summary of key news here...",
   "forecastData": [
-    {{"month": "Jan", "price": 150, "type": "history"}},
-    {{"month": "Feb", "price": 155, "type": "history"}},
-    {{"month": "Mar", "price": 160, "type": "history"}},
-    {{"month": "Apr", "price": 165, "type": "history"}},
-    {{"month": "May", "price": 170, "type": "history"}},
-    {{"month": "Jun", "price": 175, "type": "history"}},
-    {{"month": "Jul", "price": 180, "type": "history"}},
-    {{"month": "Aug", "price": 185, "type": "history"}},
-    {{"month": "Sep", "price": 190, "type": "forecast"}},
-    {{"month": "Oct", "price": 195, "type": "forecast"}},
-    {{"month": "Nov", "price": 200, "type": "forecast"}},
-    {{"month": "Dec", "price": 205, "type": "forecast"}}
+    {"month": "Jan", "price": 150, "type": "history"},
+    {"month": "Feb", "price": 155, "type": "history"},
+    {"month": "Mar", "price": 160, "type": "history"},
+    {"month": "Apr", "price": 165, "type": "history"},
+    {"month": "May", "price": 170, "type": "history"},
+    {"month": "Jun", "price": 175, "type": "history"},
+    {"month": "Jul", "price": 180, "type": "history"},
+    {"month": "Aug", "price": 185, "type": "history"},
+    {"month": "Sep", "price": 190, "type": "forecast"},
+    {"month": "Oct", "price": 195, "type": "forecast"},
+    {"month": "Nov", "price": 200, "type": "forecast"},
+    {"month": "Dec", "price": 205, "type": "forecast"}
   ],
-  "investmentAdvice": {{
+  "investmentAdvice": {
     "summary": "Investment summary...",
     "reasoning": "Reasoning for the advice...",
     "riskAssessment": "Low/Medium/High"
-  }}
-}}
-"""
-    
+  }
+}
+""")
+
+USER_PROMPT_TEMPLATE = string.Template("""
+--- START OF DATA ---
+
+**Stock Ticker:**
+$ticker
+
+**Financial Indicators:**
+$fundamentals
+
+**Recent News Articles:**
+$news
+
+--- END OF DATA ---
+
+Please provide your analysis based *only* on the data above, following all rules and the required JSON format.
+""")
+
+def build_prompt(ticker, fundamentals, relevant_chunks, citations, user_profile):
+    """
+    Builds the final prompt string to send to the LLM.
+    """
     # Format the system prompt with user profile data
-    formatted_system_prompt = system_prompt.format(
-        user_profile_financialCondition=", ".join(user_profile.financialCondition),
-        user_profile_riskTolerance=user_profile.riskTolerance,
-        user_profile_expectedReturn=user_profile.expectedReturn,
-        user_profile_tradingPreferences=user_profile.tradingPreferences
+    formatted_system_prompt = SYSTEM_PROMPT_TEMPLATE.substitute(
+        financialCondition=", ".join(user_profile.financialCondition),
+        riskTolerance=user_profile.riskTolerance,
+        expectedReturn=user_profile.expectedReturn,
+        tradingPreferences=user_profile.tradingPreferences
     )
     
     # Format the fundamentals data
-    fundamentals_str = "\n".join(f"- {key}: {value}" for key, value in fundamentals.items())
+    fundamentals_str = "\n".join(["- %s: %s" % item for item in fundamentals.items()])
     
     # Format the news chunks
     if relevant_chunks:
@@ -158,111 +303,260 @@ Analyze the provided stock data and generate a personalized report. The user is
         news_str = "No recent news articles were found or provided."
         
     # Combine it all
-    user_prompt_data = f"""
---- START OF DATA ---
-
-**Stock Ticker:**
-{ticker}
-
-**Financial Indicators:**
-{fundamentals_str}
-
-**Recent News Articles:**
-{news_str}
-
---- END OF DATA ---
-
-Please provide your analysis based *only* on the data above, following all rules and the required JSON format.
-"""
+    user_prompt_data = USER_PROMPT_TEMPLATE.substitute(
+        ticker=ticker,
+        fundamentals=fundamentals_str,
+        news=news_str
+    )
     
     return formatted_system_prompt + user_prompt_data
 
 # --- 3. AI Generation (UPDATED) ---
 
-def get_analysis(prompt_text):
+# JSON schema of the report requested in build_prompt(). Constraining the
+# output lets the model stop as soon as the object is complete and removes
+# the need to strip markdown fences from the response.
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string"},
+        "keyNews": {"type": "string"},
+        "forecastData": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "month": {"type": "string"},
+                    "price": {"type": "number"},
+                    "type": {"type": "string"},
+                },
+                "required": ["month", "price", "type"],
+            },
+        },
+        "investmentAdvice": {
+            "type": "object",
+            "properties": {
+                "summary": {"type": "string"},
+                "reasoning": {"type": "string"},
+                "riskAssessment": {"type": "string"},
+            },
+            "required": ["summary", "reasoning", "riskAssessment"],
+        },
+    },
+    "required": ["analysis", "keyNews", "forecastData", "investmentAdvice"],
+}
+
+# Decoding settings for the streamed Gemini call
+GENERATION_CONFIG = {
+    "temperature": 0.1,  # Lower temperature for more consistent results
+    "max_output_tokens": 1024,
+    "candidate_count": 1,
+    "response_mime_type": "application/json",
+    "response_schema": ANALYSIS_RESPONSE_SCHEMA,
+}
+
+def _error_response(analysis, key_news, summary, reasoning):
+    """Builds an error payload in the same shape as a successful analysis."""
+    return orjson.dumps({
+        "analysis": analysis,
+        "keyNews": key_news,
+        "forecastData": [],
+        "investmentAdvice": {
+            "summary": summary,
+            "reasoning": reasoning,
+            "riskAssessment": "Unknown"
+        }
+    }).decode()
+
+def _unavailable_response():
     """
-    Sends the prompt to the Gemini API and gets the response.
+    Returns an error payload if the Gemini API can't be used, otherwise None.
     """
     if not GEMINI_API_KEY:
-        return json.dumps({
-            "analysis": "Error: Gemini API key is not configured.",
-            "keyNews": "Please check backend configuration.",
-            "forecastData": [],
-            "investmentAdvice": {
-                "summary": "Configuration Error",
-                "reasoning": "API key missing",
-                "riskAssessment": "Unknown"
-            }
-        })
-    
+        return _error_response(
+            "Error: Gemini API key is not configured.",
+            "Please check backend configuration.",
+            "Configuration Error",
+            "API key missing"
+        )
     if model is None:
-        return json.dumps({
-            "analysis": "Error: Gemini model not initialized.",
-            "keyNews": "Please check backend configuration.",
-            "forecastData": [],
-            "investmentAdvice": {
-                "summary": "Model Error",
-                "reasoning": "AI model not available",
-                "riskAssessment": "Unknown"
-            }
-        })
-        
+        return _error_response(
+            "Error: Gemini model not initialized.",
+            "Please check backend configuration.",
+            "Model Error",
+            "AI model not available"
+        )
+    return None
+
+def parse_analysis_response(response_text):
+    """
+    Validates the raw Gemini output as JSON.
+    Returns a JSON string, falling back to a placeholder payload if invalid
+    (e.g. when the response was cut off at max_output_tokens).
+    """
     try:
-        print("Generating analysis with Gemini API...")
+        cleaned_response = response_text.strip()
+        
+        # Parse to validate it's proper JSON
+        orjson.loads(cleaned_response)
+        return cleaned_response
         
-        # Configure for JSON response
-        generation_config = {
-            "temperature": 0.1,  # Lower temperature for more consistent results
-            "max_output_tokens": 2048,
+    except orjson.JSONDecodeError:
+        # If response isn't valid JSON, create a fallback response
+        print("Warning: Gemini response was not valid JSON, creating fallback")
+        fallback_response = {
+            "analysis": f"AI Analysis: {response_text[:500]}...",
+            "keyNews": "News analysis available in main analysis",
+            "forecastData": [
+                {"month": "Jan", "price": 150, "type": "forecast"},
+                {"month": "Feb", "price": 155, "type": "forecast"},
+                {"month": "Mar", "price": 160, "type": "forecast"}
+            ],
+            "investmentAdvice": {
+                "summary": "Based on AI analysis",
+                "reasoning": "Generated from available data",
+                "riskAssessment": "Medium"
+            }
         }
+        return orjson.dumps(fallback_response).decode()
+
+def _api_error_response(e):
+    print(f"Error during Gemini API call: {e}")
+    return _error_response(
+        f"Error: Could not get analysis from API. Details: {str(e)}",
+        "API call failed",
+        "API Error",
+        "Failed to connect to AI service"
+    )
+
+class AnalysisUnavailable(Exception):
+    """
+    Raised by get_analysis_stream() when no analysis can be produced.
+    response holds the error payload (a JSON string) to return instead;
+    it must not be cached, since the failure is usually transient.
+    """
+
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
+
+async def get_analysis_stream(prompt_text):
+    """
+    Streams the Gemini response, yielding text fragments as they are generated.
+    The caller is responsible for joining the fragments and passing the
+    result through parse_analysis_response(). Raises AnalysisUnavailable if
+    the model isn't configured or the call fails, including mid-stream;
+    fragments already yielded must then be discarded.
+    """
+    unavailable = _unavailable_response()
+    if unavailable:
+        raise AnalysisUnavailable(unavailable)
         
-        response = model.generate_content(
+    try:
+        print("Streaming analysis from Gemini API...")
+        response = await model.generate_content_async(
             prompt_text,
-            generation_config=generation_config
+            stream=True,
+            generation_config=GENERATION_CONFIG
         )
-        
-        # Try to parse the response as JSON
-        try:
-            # Clean the response text
-            cleaned_response = response.text.strip()
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:]
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]
-            
-            # Parse to validate it's proper JSON
-            parsed_json = json.loads(cleaned_response)
-            return cleaned_response
-            
-        except json.JSONDecodeError:
-            # If response isn't valid JSON, create a fallback response
-            print("Warning: Gemini response was not valid JSON, creating fallback")
-            fallback_response = {
-                "analysis": f"AI Analysis: {response.text[:500]}...",
-                "keyNews": "News analysis available in main analysis",
-                "forecastData": [
-                    {"month": "Jan", "price": 150, "type": "forecast"},
-                    {"month": "Feb", "price": 155, "type": "forecast"},
-                    {"month": "Mar", "price": 160, "type": "forecast"}
-                ],
-                "investmentAdvice": {
-                    "summary": "Based on AI analysis",
-                    "reasoning": "Generated from available data",
-                    "riskAssessment": "Medium"
-                }
-            }
-            return json.dumps(fallback_response)
-        
+        async for chunk in response:
+            # Chunks without candidate parts (e.g. safety metadata) have no text
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                yield text
+                
     except Exception as e:
-        print(f"Error during Gemini API call: {e}")
-        error_response = {
-            "analysis": f"Error: Could not get analysis from API. Details: {str(e)}",
-            "keyNews": "API call failed",
-            "forecastData": [],
-            "investmentAdvice": {
-                "summary": "API Error",
-                "reasoning": "Failed to connect to AI service",
-                "riskAssessment": "Unknown"
-            }
-        }
-        return json.dumps(error_response)
+        raise AnalysisUnavailable(_api_error_response(e)) from e
+
+
+# --- 4. Request Gating ---
+
+# Optional classifier (e.g. XGBoost exported with onnxmltools) that predicts
+# whether a request will produce a useful analysis. Requests scoring below
+# the threshold get a canned response instead of a multi-second Gemini call.
+PREDICTOR_PATH = os.environ.get("PREDICTOR_PATH", "predictor.onnx")
+PREDICTOR_THRESHOLD = float(os.environ.get("PREDICTOR_THRESHOLD", "0.5"))
+predictor_session = None
+
+# Feature order expected by the exported model (19 features)
+FUNDAMENTAL_FEATURES = [
+    "Market Cap", "P/E Ratio (Trailing)", "P/E Ratio (Forward)",
+    "Price-to-Book (P/B)", "PEG Ratio", "Dividend Yield",
+    "Earnings per Share (EPS)", "Return on Equity (ROE)", "Debt-to-Equity",
+    "52 Week High", "52 Week Low", "Current Price",
+]
+RISK_TOLERANCE_CODES = {"Low": 0.0, "Medium": 1.0, "High": 2.0}
+
+def load_predictor():
+    """
+    Loads the ONNX gating model once at startup. Without onnxruntime or a
+    model file, should_analyze() falls back to a simple data-availability check.
+    """
+    global predictor_session
+    if ort is None:
+        print("onnxruntime not installed; using heuristic request gating.")
+        return None
+    if not os.path.exists(PREDICTOR_PATH):
+        print(f"No gating model at {PREDICTOR_PATH}; using heuristic request gating.")
+        return None
+    try:
+        predictor_session = ort.InferenceSession(PREDICTOR_PATH, providers=["CPUExecutionProvider"])
+        print(f"Loaded gating model from {PREDICTOR_PATH}")
+    except Exception as e:
+        print(f"Error loading gating model: {e}")
+        predictor_session = None
+    return predictor_session
+
+def build_gate_features(ticker, fundamentals, summary, news, user_profile, is_known_ticker):
+    """
+    Builds the feature vector for the gating model: one availability flag per
+    fundamental, then ticker/profile/news features.
+    """
+    available = [
+        0.0 if fundamentals.get(name, 'N/A') in ('N/A', None) else 1.0
+        for name in FUNDAMENTAL_FEATURES
+    ]
+    has_summary = 0.0 if not summary or summary.startswith("No ") else 1.0
+    return available + [
+        sum(available),
+        float(len(ticker)),
+        1.0 if is_known_ticker else 0.0,
+        RISK_TOLERANCE_CODES.get(user_profile.riskTolerance, 1.0),
+        float(user_profile.expectedReturn),
+        float(len(news)),
+        has_summary,
+    ]
+
+def should_analyze(features):
+    """
+    Returns True if the request is worth sending to Gemini.
+    """
+    if predictor_session is None:
+        # Heuristic: yfinance returns all-N/A fundamentals for unknown tickers,
+        # and without news there is nothing for the model to work with.
+        fundamentals_available, news_count = features[12], features[17]
+        return fundamentals_available > 0 or news_count > 0
+
+    try:
+        input_name = predictor_session.get_inputs()[0].name
+        outputs = predictor_session.run(None, {input_name: np.array([features], dtype=np.float32)})
+        # Classifier exports return [labels, probabilities]; probabilities are
+        # either an array or a list of {label: prob} dicts (ZipMap)
+        probabilities = outputs[-1][0]
+        p_useful = probabilities[1] if not isinstance(probabilities, dict) else probabilities.get(1, 0.0)
+        return float(p_useful) >= PREDICTOR_THRESHOLD
+    except Exception as e:
+        print(f"Error running gating model: {e}")
+        return True
+
+def insufficient_data_response(ticker):
+    """Canned payload for requests the gate decided not to send to Gemini."""
+    return _error_response(
+        f"Not enough market data or recent news was found for {ticker} to produce an analysis.",
+        "No recent news found.",
+        "Insufficient Data",
+        "Please check the ticker symbol and try again."
+    )
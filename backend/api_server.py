@@ -1,15 +1,23 @@
 import uvicorn
+import asyncio
+import hashlib
+import queue
 import sqlite3
+import threading
 import time
 import sys
 import os
-import json
 import uuid # For creating unique job IDs
-from fastapi import FastAPI, BackgroundTasks
+import faiss
+import numpy as np
+import orjson
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from contextlib import asynccontextmanager
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
 
 # --- Import from our other files ---
 try:
@@ -17,15 +25,42 @@ try:
         get_fundamentals, 
         get_news, 
         process_and_embed, 
+        content_hash,
         load_embedding_model, 
-        download_nltk_data  
+        warm_up_embedding_model,
+        download_nltk_data,
+        open_http_client,
+        close_http_client
     )
-    from ai_logic import retrieve_relevant_chunks, build_prompt, get_analysis
-    from stock_recommender import recommend_stocks
+    from ai_logic import (
+        retrieve_relevant_chunks,
+        build_prompt,
+        get_analysis_stream,
+        AnalysisUnavailable,
+        parse_analysis_response,
+        embedding_batcher,
+        load_predictor,
+        build_gate_features,
+        should_analyze,
+        insufficient_data_response
+    )
+    from stock_recommender import recommend_stocks, POPULAR_STOCKS_SET
 except ImportError as e:
     print(f"Error: Could not import from helper files: {e}")
     sys.exit(1)
 
+# --- Optional: Redis client for a cache shared across workers ---
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# --- Optional: diskcache for a single-process, file-backed analysis cache ---
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
 # --- Load API keys ---
 YOUR_API_KEY = os.environ.get("YOUR_API_KEY")
 if not YOUR_API_KEY:
@@ -53,34 +88,149 @@ async def lifespan(app: FastAPI):
     print("--- Server starting up... ---")
     print("--- Initializing database ---")
     init_db()
-    print("--- Downloading NLTK data (if needed) ---")
-    download_nltk_data()
-    print("--- Pre-loading embedding model ---")
-    load_embedding_model()
+    init_cache_backend()
+    start_cache_writer()
+    start_db_maintenance()
+    await open_http_client()
+    # Independent and mostly I/O (downloads, reading weights), so overlap them
+    print("--- Downloading NLTK data and pre-loading models ---")
+    await asyncio.gather(
+        asyncio.to_thread(download_nltk_data),
+        asyncio.to_thread(load_embedding_model),
+        asyncio.to_thread(load_predictor)
+    )
+    await asyncio.to_thread(warm_up_embedding_model)
+    embedding_batcher.start()
+    load_semantic_cache()
+    await resume_pending_jobs()
     print("--- Startup complete. Server is ready. ---")
     yield
     print("--- Server shutting down... ---")
+    # Flush queued writes first: semantic-cache entries still need embedding
+    await stop_cache_writer()
+    await embedding_batcher.stop()
+    await stop_db_maintenance()
+    await close_cache_backend()
+    await close_http_client()
+    close_db()
 
 # --- 3. Initialize FastAPI App ---
-app = FastAPI(lifespan=lifespan) 
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Comma-separated list of allowed frontend origins (e.g. the Vercel URL).
+# Unset, only the local Next.js dev server is allowed, never a wildcard.
+DEV_FRONTEND_ORIGIN = "http://localhost:3000"
+FRONTEND_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get("FRONTEND_ORIGIN", "").split(",")
+    if origin.strip()
+]
+if not FRONTEND_ORIGINS:
+    print(f"Warning: FRONTEND_ORIGIN is not set; allowing only {DEV_FRONTEND_ORIGIN} (development only).")
+    FRONTEND_ORIGINS = [DEV_FRONTEND_ORIGIN]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"], allow_credentials=True,
-    allow_methods=["*"], allow_headers=["*"],
+    allow_origins=FRONTEND_ORIGINS, allow_credentials=True,
+    allow_methods=["GET", "POST"], allow_headers=["content-type", "authorization"],
+    max_age=86400,  # let browsers cache the preflight for a day
 )
 
 # --- 4. Caching & Database Logic (UPDATED) ---
 DB_NAME = os.environ.get("DB_NAME", "analysis_cache.db")
 CACHE_DURATION = 3600  # 1 hour
 
+# "sqlite" (default, fine for local dev / one worker), "diskcache" (one
+# process, cheaper writes than a SQLite REPLACE + commit per analysis) or
+# "redis" so that several uvicorn/gunicorn workers share one cache instead
+# of contending for the SQLite write lock. Jobs stay in SQLite unless Redis
+# is used.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite").lower()
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+DISKCACHE_DIR = os.environ.get("DISKCACHE_DIR", os.path.join("cache", "analysis"))  # git-ignored
+redis_client = None
+disk_cache = None
+
+# In-process LRU in front of SQLite/Redis so hot tickers are served from RAM.
+# Entries expire after CACHE_DURATION, like the shared tier. Per process, so
+# with several workers Redis remains the shared tier.
+MEMORY_CACHE_SIZE = int(os.environ.get("MEMORY_CACHE_SIZE", "512"))
+_memory_cache = OrderedDict()  # cache_key -> (analysis, timestamp)
+_memory_cache_lock = threading.Lock()
+
+# Pool of persistent connections. Each connection is only used by one
+# thread at a time: get_conn() checks it out of the queue. Connections are
+# opened on demand, up to DB_POOL_SIZE, and the schema is created on first
+# use if init_db() hasn't run (e.g. when this module is imported elsewhere).
+DB_POOL_SIZE = 8
+# Seconds to wait for a free connection once all DB_POOL_SIZE are checked out
+DB_POOL_TIMEOUT = 30
+_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+_pool_lock = threading.Lock()
+_pool_opened = 0
+_db_ready = False
+
+def _open_conn():
+    # isolation_level=None: autocommit, so single statements need no commit()
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, isolation_level=None)
+    # WAL lets readers proceed while a write is in progress
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache per connection
+    return conn
+
+@contextmanager
+def get_conn():
+    """Checks a connection out of the pool and returns it afterwards."""
+    global _pool_opened
+    if not _db_ready:
+        init_db()
+    try:
+        conn = _POOL.get_nowait()
+    except queue.Empty:
+        with _pool_lock:
+            can_open = _pool_opened < DB_POOL_SIZE
+            if can_open:
+                _pool_opened += 1
+        if can_open:
+            try:
+                conn = _open_conn()
+            except Exception:
+                # Give the slot back, or failed opens would shrink the pool to nothing
+                with _pool_lock:
+                    _pool_opened -= 1
+                raise
+        else:
+            try:
+                conn = _POOL.get(timeout=DB_POOL_TIMEOUT)
+            except queue.Empty:
+                raise sqlite3.OperationalError("Timed out waiting for a database connection")
+    try:
+        yield conn
+    finally:
+        _POOL.put(conn)
+
 def init_db():
+    with _pool_lock:
+        if not _db_ready:
+            _init_schema()
+
+def _init_schema():
+    global _pool_opened, _db_ready
     db_dir = os.path.dirname(DB_NAME)
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir)
-    conn = sqlite3.connect(DB_NAME)
+    conn = _open_conn()
     c = conn.cursor()
     
-    # Cache for *individual tickers* (from previous version)
+    # Incremental auto-vacuum lets run_db_maintenance() hand freed pages back
+    # to the OS. The mode only changes on an existing file after a VACUUM.
+    if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("VACUUM")
+    
+    # Cache of finished analyses, keyed by make_cache_key() (ticker + profile hash)
     c.execute('''
         CREATE TABLE IF NOT EXISTS cache
         (ticker TEXT PRIMARY KEY,
@@ -88,6 +238,21 @@ def init_db():
          timestamp REAL)
     ''')
     
+    # Trading-preference embeddings of cached analyses, for near-duplicate
+    # lookups within one semantic_profile_key() bucket
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS semantic_cache
+        (id INTEGER PRIMARY KEY,
+         ticker TEXT,
+         embedding BLOB,
+         analysis TEXT,
+         timestamp REAL)
+    ''')
+    # Rows without a profile key embedded the whole profile; they are ignored
+    semantic_columns = {row[1] for row in c.execute("PRAGMA table_info(semantic_cache)")}
+    if "profile_key" not in semantic_columns:
+        c.execute("ALTER TABLE semantic_cache ADD COLUMN profile_key TEXT")
+    
     # --- NEW: Table to track job status ---
     c.execute('''
         CREATE TABLE IF NOT EXISTS jobs
@@ -96,163 +261,942 @@ def init_db():
          result TEXT,
          timestamp REAL)
     ''')
-    conn.commit()
-    conn.close()
+    # The request is stored with the job so pending jobs survive a restart
+    columns = {row[1] for row in c.execute("PRAGMA table_info(jobs)")}
+    if "request" not in columns:
+        c.execute("ALTER TABLE jobs ADD COLUMN request TEXT")
+    if "attempts" not in columns:
+        c.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0")
+    
+    # Timestamp indexes keep the expiry DELETEs in run_db_maintenance() cheap
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ts ON jobs(timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cache_ts ON cache(timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_semantic_cache_ts ON semantic_cache(timestamp)")
+    
+    _POOL.put(conn)
+    _pool_opened += 1
+    _db_ready = True
+
+def close_db():
+    global _pool_opened, _db_ready
+    with _pool_lock:
+        while not _POOL.empty():
+            _POOL.get_nowait().close()
+        _pool_opened = 0
+        _db_ready = False
+
+# --- Database maintenance ---
+# Nothing else deletes rows: finished jobs stay forever and expired cache
+# rows are only skipped on read. An hourly task drops both and vacuums.
+JOB_RETENTION = 24 * 3600  # 1 day
+DB_MAINTENANCE_INTERVAL = 3600  # 1 hour
+db_maintenance_task = None
+
+def _expire_rows_sync():
+    now = time.time()
+    with get_conn() as conn:
+        jobs = conn.execute("DELETE FROM jobs WHERE timestamp < ?", (now - JOB_RETENTION,)).rowcount
+        cache = conn.execute("DELETE FROM cache WHERE timestamp < ?", (now - CACHE_DURATION,)).rowcount
+        conn.execute("DELETE FROM semantic_cache WHERE timestamp < ?", (now - CACHE_DURATION,))
+        conn.execute("PRAGMA incremental_vacuum")
+    return jobs, cache
+
+async def run_db_maintenance():
+    try:
+        jobs, cache = await asyncio.to_thread(_expire_rows_sync)
+        _prune_semantic_indices()
+        print(f"--- DB maintenance: removed {jobs} old jobs and {cache} expired cache rows ---")
+    except Exception as e:
+        print(f"Warning: DB maintenance failed: {e}")
+
+async def _db_maintenance_loop():
+    while True:
+        await run_db_maintenance()
+        await asyncio.sleep(DB_MAINTENANCE_INTERVAL)
+
+def start_db_maintenance():
+    global db_maintenance_task
+    db_maintenance_task = asyncio.create_task(_db_maintenance_loop())
+
+async def stop_db_maintenance():
+    global db_maintenance_task
+    if db_maintenance_task is None:
+        return
+    db_maintenance_task.cancel()
+    try:
+        await db_maintenance_task
+    except asyncio.CancelledError:
+        pass
+    db_maintenance_task = None
+
+# --- SQL statements ---
+# Kept as constants so each pooled connection's statement cache (keyed on
+# the SQL text) reuses the prepared statement instead of re-parsing it.
+_SQL_INSERT_JOB = "INSERT INTO jobs (job_id, status, result, timestamp, request, attempts) VALUES (?, ?, ?, ?, ?, ?)"
+_SQL_UPDATE_JOB = "UPDATE jobs SET status = ?, result = ? WHERE job_id = ?"
+_SQL_SELECT_JOB = "SELECT status, result FROM jobs WHERE job_id = ?"
+_SQL_SELECT_CACHE = "SELECT analysis, timestamp FROM cache WHERE ticker = ?"
+# UPSERT updates in place instead of REPLACE's delete + insert
+_SQL_UPSERT_CACHE = '''
+    INSERT INTO cache (ticker, analysis, timestamp) VALUES (?, ?, ?)
+    ON CONFLICT(ticker) DO UPDATE SET
+        analysis = excluded.analysis,
+        timestamp = excluded.timestamp
+'''
 
 # --- Job Status Functions ---
-def create_job(job_id: str):
+def _create_job_sync(job_id: str, request_json: str):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("INSERT INTO jobs (job_id, status, result, timestamp) VALUES (?, ?, ?, ?)",
-                  (job_id, "pending", None, time.time()))
-        conn.commit()
-        conn.close()
+        with get_conn() as conn:
+            conn.execute(_SQL_INSERT_JOB, (job_id, "pending", None, time.time(), request_json, 1))
     except Exception as e:
         print(f"Error creating job: {e}")
 
-def update_job_complete(job_id: str, result: str):
+def _update_job_complete_sync(job_id: str, result: str):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("UPDATE jobs SET status = ?, result = ? WHERE job_id = ?",
-                  ("complete", result, job_id))
-        conn.commit()
-        conn.close()
+        with get_conn() as conn:
+            conn.execute(_SQL_UPDATE_JOB, ("complete", result, job_id))
     except Exception as e:
         print(f"Error updating job to complete: {e}")
 
-def update_job_failed(job_id: str, error_message: str):
+def _update_job_failed_sync(job_id: str, error_message: str):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("UPDATE jobs SET status = ?, result = ? WHERE job_id = ?",
-                  ("failed", error_message, job_id))
-        conn.commit()
-        conn.close()
+        with get_conn() as conn:
+            conn.execute(_SQL_UPDATE_JOB, ("failed", error_message, job_id))
     except Exception as e:
         print(f"Error updating job to failed: {e}")
 
-def get_job_status(job_id: str):
+def _get_job_status_sync(job_id: str):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT status, result FROM jobs WHERE job_id = ?", (job_id,))
-        result = c.fetchone()
-        conn.close()
+        with get_conn() as conn:
+            result = conn.execute(_SQL_SELECT_JOB, (job_id,)).fetchone()
         if result:
             return {"status": result[0], "result": result[1]}
     except Exception as e:
         print(f"Error getting job status: {e}")
     return {"status": "not_found", "result": None}
 
-# --- Caching Functions (Unchanged) ---
-def get_cached_analysis(ticker):
+# The endpoints and background task run on the event loop, so the SQLite
+# calls above are pushed to worker threads instead of blocking it.
+# With CACHE_BACKEND=redis, job state lives in Redis hashes instead
+# ("job:<id>", expiring after JOB_RETENTION): no disk writes for transient
+# state, and finished jobs are announced on the "job:<id>" channel so
+# waiters in every worker wake up immediately.
+async def _set_job_redis(job_id: str, status: str, result: str):
+    key = f"job:{job_id}"
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping={"status": status, "result": result})
+        pipe.expire(key, JOB_RETENTION)
+        if status != "pending":
+            pipe.publish(key, status)
+        await pipe.execute()
+
+async def _get_job_status_redis(job_id: str):
+    job = await redis_client.hgetall(f"job:{job_id}")
+    if not job:
+        return {"status": "not_found", "result": None}
+    return {"status": job[b"status"].decode(), "result": job[b"result"].decode() or None}
+
+async def create_job(job_id: str, request: AnalysisRequest):
+    if redis_client is not None:
+        await _set_job_redis(job_id, "pending", "")
+        return
+    await asyncio.to_thread(_create_job_sync, job_id, request.model_dump_json())
+
+async def update_job_complete(job_id: str, result: str):
+    if redis_client is not None:
+        await _set_job_redis(job_id, "complete", result)
+    else:
+        await asyncio.to_thread(_update_job_complete_sync, job_id, result)
+    _notify_job_done(job_id)
+
+async def update_job_failed(job_id: str, error_message: str):
+    if redis_client is not None:
+        await _set_job_redis(job_id, "failed", error_message)
+    else:
+        await asyncio.to_thread(_update_job_failed_sync, job_id, error_message)
+    _notify_job_done(job_id)
+
+async def get_job_status(job_id: str):
+    if redis_client is not None:
+        try:
+            return await _get_job_status_redis(job_id)
+        except Exception as e:
+            print(f"Error getting job status from Redis: {e}")
+            return {"status": "not_found", "result": None}
+    return await asyncio.to_thread(_get_job_status_sync, job_id)
+
+# --- Job completion push (WebSocket / SSE) ---
+# Waiters register an event per job_id; finishing a job sets it, so clients
+# are told as soon as the result is written instead of polling for it.
+# Events are per process, so waiters also re-read the DB every
+# JOB_STATUS_RECHECK seconds in case another worker ran the job.
+JOB_STATUS_RECHECK = 15
+_job_events = {}  # job_id -> asyncio.Event
+_job_waiters = {}  # job_id -> number of wait_for_job calls using its event
+
+def _notify_job_done(job_id: str):
+    event = _job_events.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+async def _wait_for_job_redis(job_id: str):
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe(f"job:{job_id}")
+    try:
+        while True:
+            status = await get_job_status(job_id)
+            if status["status"] != "pending":
+                return status
+            await pubsub.get_message(ignore_subscribe_messages=True, timeout=JOB_STATUS_RECHECK)
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+async def wait_for_job(job_id: str):
+    """Waits until a job is no longer pending and returns its status."""
+    if redis_client is not None:
+        return await _wait_for_job_redis(job_id)
+    _job_waiters[job_id] = _job_waiters.get(job_id, 0) + 1
+    try:
+        while True:
+            # Register before reading so a completion in between isn't missed
+            event = _job_events.setdefault(job_id, asyncio.Event())
+            status = await get_job_status(job_id)
+            if status["status"] != "pending":
+                return status
+            try:
+                await asyncio.wait_for(event.wait(), JOB_STATUS_RECHECK)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        # Also reached when the waiter is cancelled (e.g. the client left)
+        _job_waiters[job_id] -= 1
+        if not _job_waiters[job_id]:
+            del _job_waiters[job_id]
+            _job_events.pop(job_id, None)
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    """Returns once the client disconnects; anything it sends is ignored."""
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+# --- Caching Functions ---
+def make_cache_key(request: AnalysisRequest) -> str:
+    """
+    Builds the cache key for a request. The advice is tailored to the user
+    profile, so the key covers the profile as well as the ticker.
+    """
+    profile = {
+        "financialCondition": request.financialCondition,
+        "expectedReturn": request.expectedReturn,
+        "riskTolerance": request.riskTolerance,
+        "tradingPreferences": request.tradingPreferences,
+    }
+    digest = hashlib.blake2b(
+        orjson.dumps(profile, option=orjson.OPT_SORT_KEYS), digest_size=16
+    ).hexdigest()
+    return f"{request.ticker.upper()}:{digest}"
+
+def _memory_cache_get(cache_key):
+    with _memory_cache_lock:
+        entry = _memory_cache.get(cache_key)
+        if entry is None:
+            return None
+        analysis, timestamp = entry
+        if (time.time() - timestamp) >= CACHE_DURATION:
+            del _memory_cache[cache_key]
+            return None
+        _memory_cache.move_to_end(cache_key)
+        return analysis
+
+def _memory_cache_put(cache_key, analysis, timestamp):
+    with _memory_cache_lock:
+        _memory_cache[cache_key] = (analysis, timestamp)
+        _memory_cache.move_to_end(cache_key)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def _get_cached_analysis_sync(cache_key):
+    """Returns (analysis, timestamp) for a fresh SQLite entry, or None."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT analysis, timestamp FROM cache WHERE ticker = ?", (ticker,))
-        result = c.fetchone()
-        conn.close()
+        with get_conn() as conn:
+            result = conn.execute(_SQL_SELECT_CACHE, (cache_key,)).fetchone()
         if result:
             analysis, timestamp = result
             if (time.time() - timestamp) < CACHE_DURATION:
-                return analysis
+                return analysis, timestamp
     except sqlite3.OperationalError:
         print(f"Warning: Could not read from cache database at {DB_NAME}")
     return None
 
-def set_cached_analysis(ticker, analysis):
+def _set_cached_analyses_sync(rows):
+    """Writes many (cache_key, analysis, timestamp) rows in one transaction (one commit)."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("REPLACE INTO cache (ticker, analysis, timestamp) VALUES (?, ?, ?)",
-                  (ticker, analysis, time.time()))
-        conn.commit()
-        conn.close()
+        with get_conn() as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(_SQL_UPSERT_CACHE, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
     except sqlite3.OperationalError:
         print(f"Warning: Could not write to cache database at {DB_NAME}")
 
+def _complete_job_with_cache_sync(job_id, cache_key, analysis, timestamp):
+    """Caches the analysis and completes the job in one transaction (one commit)."""
+    try:
+        with get_conn() as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.execute(_SQL_UPSERT_CACHE, (cache_key, analysis, timestamp))
+                conn.execute(_SQL_UPDATE_JOB, ("complete", analysis, job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    except Exception as e:
+        print(f"Error completing job with cached result: {e}")
+
+def init_cache_backend():
+    """
+    Connects to Redis when CACHE_BACKEND=redis, or opens the diskcache
+    directory when CACHE_BACKEND=diskcache; SQLite needs no setup here.
+    """
+    global redis_client, disk_cache
+    if CACHE_BACKEND == "diskcache":
+        if diskcache is None:
+            print("Warning: CACHE_BACKEND=diskcache but the 'diskcache' library is not installed. Using SQLite.")
+            return
+        disk_cache = diskcache.Cache(DISKCACHE_DIR)
+        print(f"Using diskcache analysis cache at {DISKCACHE_DIR}")
+        return
+    if CACHE_BACKEND != "redis":
+        return
+    if aioredis is None:
+        print("Warning: CACHE_BACKEND=redis but the 'redis' library is not installed. Using SQLite.")
+        return
+    redis_client = aioredis.Redis.from_url(REDIS_URL)
+    print(f"Using Redis analysis cache at {REDIS_URL}")
+
+async def close_cache_backend():
+    global redis_client, disk_cache
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+    if disk_cache is not None:
+        disk_cache.close()
+        disk_cache = None
+
+def _get_cached_analysis_disk(cache_key):
+    """Returns (analysis, timestamp) from diskcache, or None. Expiry is enforced by diskcache."""
+    try:
+        return disk_cache.get(cache_key)
+    except Exception as e:
+        print(f"Warning: Could not read from diskcache: {e}")
+        return None
+
+def _set_cached_analyses_disk(rows):
+    try:
+        with disk_cache.transact():
+            for cache_key, analysis, timestamp in rows:
+                disk_cache.set(cache_key, (analysis, timestamp), expire=CACHE_DURATION)
+    except Exception as e:
+        print(f"Warning: Could not write to diskcache: {e}")
+
+async def _get_cached_analysis_redis(cache_key):
+    """Returns (analysis, timestamp) from Redis, or None."""
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            analysis, ttl = await pipe.get(f"analysis:{cache_key}").ttl(f"analysis:{cache_key}").execute()
+        if analysis is None:
+            return None
+        # Recover the write time from the remaining TTL for the memory LRU
+        timestamp = time.time() - (CACHE_DURATION - max(ttl, 0))
+        return analysis.decode(), timestamp
+    except Exception as e:
+        print(f"Warning: Could not read from Redis cache: {e}")
+        return None
+
+async def _set_cached_analyses_redis(rows):
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for cache_key, analysis, _ in rows:
+                pipe.set(f"analysis:{cache_key}", analysis, ex=CACHE_DURATION)
+            await pipe.execute()
+    except Exception as e:
+        print(f"Warning: Could not write to Redis cache: {e}")
+
+async def get_cached_analysis(cache_key, request: Optional[AnalysisRequest] = None):
+    """
+    Reads a fresh cached analysis, checking the in-memory LRU before the
+    shared backend. SQLite is read in a worker thread so the event loop
+    isn't blocked. If request is given, an exact miss falls back to the
+    semantic cache.
+    """
+    analysis = _memory_cache_get(cache_key)
+    if analysis is not None:
+        return analysis
+    
+    if redis_client is not None:
+        result = await _get_cached_analysis_redis(cache_key)
+    elif disk_cache is not None:
+        result = await asyncio.to_thread(_get_cached_analysis_disk, cache_key)
+    else:
+        result = await asyncio.to_thread(_get_cached_analysis_sync, cache_key)
+    if result is None:
+        if request is not None:
+            return await semantic_cache_get(request)
+        return None
+    analysis, timestamp = result
+    _memory_cache_put(cache_key, analysis, timestamp)
+    return analysis
+
+async def _write_cached_analyses(rows):
+    """
+    Writes (cache_key, analysis, timestamp) rows to the shared backend as one
+    batch: one SQLite transaction, one diskcache transact() or one Redis
+    pipeline.
+    """
+    if redis_client is not None:
+        await _set_cached_analyses_redis(rows)
+    elif disk_cache is not None:
+        await asyncio.to_thread(_set_cached_analyses_disk, rows)
+    else:
+        await asyncio.to_thread(_set_cached_analyses_sync, rows)
+
+# --- Write-behind queue ---
+# Persisting to the shared cache is taken off the response path: callers
+# update the in-memory LRU and enqueue the write, and a single background
+# task drains the queue. Items are (kind, args): "analysis" writes an
+# exact-key entry, "semantic" embeds the profile and adds it to the
+# semantic cache. Exact-key writes that pile up while the writer is busy
+# are flushed together in one batch.
+cache_write_queue = None
+cache_writer_task = None
+
+async def _run_cache_write(kind, args):
+    if kind == "analysis":
+        await _write_cached_analyses([args])
+    else:
+        await semantic_cache_put(*args)
+
+async def _queue_cache_write(kind, *args):
+    """Hands a write to the background writer, or runs it inline if the writer isn't running."""
+    if cache_writer_task is not None:
+        cache_write_queue.put_nowait((kind, args))
+    else:
+        await _run_cache_write(kind, args)
+
+async def _cache_writer():
+    while True:
+        items = [await cache_write_queue.get()]
+        while not cache_write_queue.empty():
+            items.append(cache_write_queue.get_nowait())
+        try:
+            rows = [args for kind, args in items if kind == "analysis"]
+            if rows:
+                try:
+                    await _write_cached_analyses(rows)
+                except Exception as e:
+                    print(f"Warning: Background cache write failed: {e}")
+            for kind, args in items:
+                if kind != "semantic":
+                    continue
+                try:
+                    await semantic_cache_put(*args)
+                except Exception as e:
+                    print(f"Warning: Background semantic cache write failed: {e}")
+        finally:
+            for _ in items:
+                cache_write_queue.task_done()
+
+def start_cache_writer():
+    global cache_write_queue, cache_writer_task
+    cache_write_queue = asyncio.Queue()
+    cache_writer_task = asyncio.create_task(_cache_writer())
+
+async def stop_cache_writer():
+    """Flushes pending writes, then stops the writer task."""
+    global cache_writer_task
+    if cache_writer_task is None:
+        return
+    await cache_write_queue.join()
+    cache_writer_task.cancel()
+    try:
+        await cache_writer_task
+    except asyncio.CancelledError:
+        pass
+    cache_writer_task = None
+
+async def set_cached_analysis(cache_key, analysis, request: Optional[AnalysisRequest] = None):
+    """
+    Stores an analysis in the in-memory LRU immediately and queues the
+    write to the shared backend, so the caller never waits on disk I/O.
+    If request is given, the analysis is also queued for the semantic cache.
+    """
+    timestamp = time.time()
+    _memory_cache_put(cache_key, analysis, timestamp)
+    await _queue_cache_write("analysis", cache_key, analysis, timestamp)
+    if request is not None:
+        await _queue_cache_write("semantic", request, analysis, timestamp)
+
+async def complete_job_with_cache(job_id: str, cache_key, analysis, request: AnalysisRequest):
+    """
+    Caches a finished analysis and marks its job complete. With the SQLite
+    backend both rows are written in a single transaction.
+    """
+    if redis_client is not None or disk_cache is not None:
+        await set_cached_analysis(cache_key, analysis, request)
+        await update_job_complete(job_id, analysis)
+        return
+    timestamp = time.time()
+    _memory_cache_put(cache_key, analysis, timestamp)
+    await asyncio.to_thread(_complete_job_with_cache_sync, job_id, cache_key, analysis, timestamp)
+    _notify_job_done(job_id)
+    await _queue_cache_write("semantic", request, analysis, timestamp)
+
+# --- Semantic cache ---
+# Exact keys only match byte-identical profiles. This cache also serves
+# requests whose free-text trading preferences are near-identical (cosine
+# similarity >= SEMANTIC_CACHE_THRESHOLD). The structured fields (ticker,
+# risk tolerance, expected return, financial condition) must match exactly:
+# a small wording change in one string can't flip "Low" to "High". One flat
+# inner-product index per semantic_profile_key() is kept in memory and
+# rebuilt from SQLite at startup.
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+_semantic_indices = {}  # profile key -> (faiss.IndexFlatIP, [(analysis, timestamp), ...])
+
+def semantic_profile_key(request: AnalysisRequest) -> str:
+    """Bucket for the semantic cache: the request fields that must match exactly."""
+    return orjson.dumps([
+        request.ticker.upper(),
+        request.riskTolerance,
+        request.expectedReturn,
+        request.financialCondition,
+    ]).decode()
+
+async def _embed_profile(request: AnalysisRequest):
+    """Returns the L2-normalized 1xD trading-preferences embedding, or None on failure."""
+    try:
+        embedding = await embedding_batcher.submit(request.tradingPreferences)
+    except Exception as e:
+        print(f"Warning: Could not embed profile for semantic cache: {e}")
+        return None
+    embedding = np.array(embedding, dtype='float32')  # copy; the batcher caches its result
+    faiss.normalize_L2(embedding)
+    return embedding
+
+def _semantic_add(profile_key, embedding, analysis, timestamp):
+    entry = _semantic_indices.get(profile_key)
+    if entry is None:
+        entry = (faiss.IndexFlatIP(embedding.shape[1]), [])
+        _semantic_indices[profile_key] = entry
+    index, rows = entry
+    index.add(embedding)
+    rows.append((analysis, timestamp))
+
+def _prune_semantic_indices():
+    """Rebuilds the in-memory indices without expired entries."""
+    cutoff = time.time() - CACHE_DURATION
+    for profile_key, (index, rows) in list(_semantic_indices.items()):
+        keep = [i for i, (_, timestamp) in enumerate(rows) if timestamp >= cutoff]
+        if len(keep) == len(rows):
+            continue
+        if not keep:
+            del _semantic_indices[profile_key]
+            continue
+        embeddings = index.reconstruct_n(0, index.ntotal)[keep]
+        pruned = faiss.IndexFlatIP(index.d)
+        pruned.add(embeddings)
+        _semantic_indices[profile_key] = (pruned, [rows[i] for i in keep])
+
+def _insert_semantic_sync(ticker, profile_key, embedding, analysis, timestamp):
+    try:
+        with get_conn() as conn:
+            conn.execute(
+                "INSERT INTO semantic_cache (ticker, profile_key, embedding, analysis, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (ticker, profile_key, embedding.tobytes(), analysis, timestamp)
+            )
+    except sqlite3.OperationalError:
+        print(f"Warning: Could not write to semantic cache at {DB_NAME}")
+
+def load_semantic_cache():
+    """Rebuilds the in-memory indices from fresh semantic_cache rows."""
+    try:
+        with get_conn() as conn:
+            rows = conn.execute(
+                "SELECT profile_key, embedding, analysis, timestamp FROM semantic_cache "
+                "WHERE timestamp > ? AND profile_key IS NOT NULL",
+                (time.time() - CACHE_DURATION,)
+            ).fetchall()
+    except sqlite3.OperationalError:
+        print(f"Warning: Could not read semantic cache from {DB_NAME}")
+        return
+    for profile_key, blob, analysis, timestamp in rows:
+        embedding = np.frombuffer(blob, dtype='float32').reshape(1, -1)
+        _semantic_add(profile_key, embedding, analysis, timestamp)
+    print(f"Loaded {len(rows)} semantic cache entries.")
+
+async def semantic_cache_get(request: AnalysisRequest):
+    """Returns a fresh analysis for a near-identical profile, or None."""
+    entry = _semantic_indices.get(semantic_profile_key(request))
+    if entry is None:
+        return None
+    embedding = await _embed_profile(request)
+    if embedding is None:
+        return None
+    index, rows = entry
+    # A few neighbours, in case the closest one has expired
+    scores, ids = index.search(embedding, min(4, index.ntotal))
+    now = time.time()
+    for score, i in zip(scores[0].tolist(), ids[0].tolist()):
+        if i < 0 or score < SEMANTIC_CACHE_THRESHOLD:
+            break
+        analysis, timestamp = rows[i]
+        if (now - timestamp) < CACHE_DURATION:
+            print(f"Semantic cache hit for {request.ticker.upper()} (similarity {score:.3f})")
+            return analysis
+    return None
+
+async def semantic_cache_put(request: AnalysisRequest, analysis, timestamp):
+    embedding = await _embed_profile(request)
+    if embedding is None:
+        return
+    profile_key = semantic_profile_key(request)
+    _semantic_add(profile_key, embedding, analysis, timestamp)
+    await asyncio.to_thread(
+        _insert_semantic_sync, request.ticker.upper(), profile_key, embedding, analysis, timestamp
+    )
+
 # --- 5. The Long-Running Analysis Task (NEW) ---
-def run_full_analysis_task(job_id: str, request: AnalysisRequest):
+async def prepare_analysis_prompt(ticker: str, request: AnalysisRequest, log_prefix: str):
+    """
+    Fetches fundamentals and news, runs RAG retrieval and builds the LLM prompt.
+    Returns the prompt text and the list of citations, or (None, []) if the
+    request gate decides the ticker isn't worth a Gemini call.
+    Blocking helpers run in worker threads so the event loop stays responsive.
+    """
+    if not YOUR_API_KEY:
+        raise Exception("Server Configuration Error: NewsAPI key is not set.")
+
+    # Fundamentals and news are independent I/O calls, so fetch them concurrently
+    print(f"{log_prefix} Fetching fundamentals and news...")
+    (fundamentals, summary), news = await asyncio.gather(
+        asyncio.to_thread(get_fundamentals, ticker),  # yfinance is sync-only
+        get_news(ticker, YOUR_API_KEY)
+    )
+    if not fundamentals:
+        raise Exception(f"Could not fetch fundamental data for ticker: {ticker}")
+    
+    features = build_gate_features(
+        ticker, fundamentals, summary, news, request, ticker in POPULAR_STOCKS_SET
+    )
+    if not should_analyze(features):
+        print(f"{log_prefix} Request gated; skipping embedding and Gemini call.")
+        return None, []
+    
+    print(f"{log_prefix} Processing and embedding data...")
+    vector_index, text_chunks, metadata = await asyncio.to_thread(
+        process_and_embed, news, summary, ticker
+    )
+    
+    query = f"Recent news, developments, and user context for {ticker}"
+    query_embedding = None
+    if vector_index is not None:
+        try:
+            # Batched with queries from other in-flight requests
+            query_embedding = await embedding_batcher.submit(query)
+        except Exception as e:
+            print(f"{log_prefix} Error encoding query: {e}")
+    relevant_chunks, citations = await asyncio.to_thread(
+        retrieve_relevant_chunks, query, vector_index, text_chunks, metadata,
+        query_embedding=query_embedding,
+        content_key=(ticker, content_hash(news, summary))
+    )
+    
+    print(f"{log_prefix} Building AI prompt...")
+    user_prompt = build_prompt(
+        ticker=request.ticker,
+        fundamentals=fundamentals,
+        relevant_chunks=relevant_chunks,
+        citations=citations,
+        user_profile=request  
+    )
+    return user_prompt, citations
+
+def get_recommendations(request: AnalysisRequest):
+    """Runs the rule-based stock recommender for the user's profile."""
+    return recommend_stocks(
+        trading_history=request.tradingPreferences,
+        financial_condition=request.financialCondition,
+        expected_return=request.expectedReturn,
+        risk_tolerance=request.riskTolerance
+    )
+
+def combine_results(ai_json_string: str, recommendations_list, citations) -> str:
+    """Merges the AI analysis, recommendations and citations into one JSON string."""
+    ai_data = orjson.loads(ai_json_string)
+    ai_data['recommendedStocks'] = recommendations_list
+    
+    if citations:
+        citation_header = "\n\n--- Sources ---\n"
+        citation_list = "\n".join(citations)
+        ai_data['analysis'] += citation_header + citation_list
+    
+    return orjson.dumps(ai_data).decode()
+
+# Caps the analyses doing real work at once, so a burst of requests doesn't
+# have dozens of embedding passes and recommender threads competing for CPU
+MAX_CONCURRENT_ANALYSES = int(os.environ.get("MAX_CONCURRENT_ANALYSES", "4"))
+analysis_semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+async def run_ai_analysis(ticker: str, request: AnalysisRequest, log_prefix: str, token_stream=None):
+    """
+    Runs the news/RAG/Gemini pipeline. Returns (ai_json_string, citations,
+    cacheable); cacheable is False for responses that must not be cached
+    (e.g. a gated request, whose data sources may just be failing briefly).
+    Gemini is always streamed; if a JobTokenStream is given, each fragment
+    is published to it as it arrives.
+    """
+    user_prompt, citations = await prepare_analysis_prompt(ticker, request, log_prefix)
+    if user_prompt is None:
+        return insufficient_data_response(ticker), citations, False
+    
+    buffered_text = []
+    try:
+        async for text in get_analysis_stream(user_prompt):
+            buffered_text.append(text)
+            if token_stream is not None:
+                token_stream.publish(text)
+    except AnalysisUnavailable as e:
+        # Partial output plus an error isn't valid JSON; return the error alone
+        print(f"{log_prefix} Gemini analysis failed; result will not be cached.")
+        return e.response, citations, False
+    return parse_analysis_response("".join(buffered_text)), citations, True
+
+async def run_full_analysis_task(job_id: str, request: AnalysisRequest, semantic_checked: bool = False):
     """
     This is the long-running function that runs in the background.
+    semantic_checked means the caller already missed the semantic cache,
+    so only the (cheap) exact-key lookup is repeated.
     """
     try:
         ticker = request.ticker.upper()
-        print(f"--- [Background Job: {job_id}] Starting analysis for {ticker} ---")
+        cache_key = make_cache_key(request)
+        log_prefix = f"[Background Job: {job_id}]"
+        print(f"--- {log_prefix} Starting analysis for {ticker} ---")
         
         # 1. Check cache first
-        cached_result = get_cached_analysis(ticker)
+        cached_result = await get_cached_analysis(cache_key, None if semantic_checked else request)
         if cached_result:
-            print(f"[Background Job: {job_id}] Found cached result.")
-            update_job_complete(job_id, cached_result)
+            print(f"{log_prefix} Found cached result.")
+            await update_job_complete(job_id, cached_result)
             return
 
-        if not YOUR_API_KEY:
-            raise Exception("Server Configuration Error: NewsAPI key is not set.")
-
-        # --- TASK 1: Get AI Analysis (Forecast, Advice) ---
-        print(f"[Background Job: {job_id}] Fetching fundamentals...")
-        fundamentals, summary = get_fundamentals(ticker)
-        if not fundamentals:
-            raise Exception(f"Could not fetch fundamental data for ticker: {ticker}")
-
-        print(f"[Background Job: {job_id}] Fetching news...")
-        news = get_news(ticker, YOUR_API_KEY)
-        
-        print(f"[Background Job: {job_id}] Processing and embedding data...")
-        vector_index, text_chunks, metadata = process_and_embed(news, summary, ticker)
-        
-        query = f"Recent news, developments, and user context for {ticker}"
-        relevant_chunks, citations = retrieve_relevant_chunks(
-            query, vector_index, text_chunks, metadata
-        )
-        
-        print(f"[Background Job: {job_id}] Building AI prompt...")
-        user_prompt = build_prompt(
-            ticker=request.ticker,
-            fundamentals=fundamentals,
-            relevant_chunks=relevant_chunks,
-            citations=citations,
-            user_profile=request  
-        )
-        
-        ai_json_string = get_analysis(user_prompt)
-        
-        # --- TASK 2: Get Rule-Based Recommendations (THE SLOW PART) ---
-        print(f"[Background Job: {job_id}] Running rule-based stock recommender...")
-        recommendations_list = recommend_stocks(
-            trading_history=request.tradingPreferences,
-            financial_condition=request.financialCondition,
-            expected_return=request.expectedReturn,
-            risk_tolerance=request.riskTolerance
-        )
+        # --- TASK 1 & 2: AI Analysis (Forecast, Advice) and Rule-Based Recommendations ---
+        # Independent of each other, so the recommender (THE SLOW PART) runs
+        # in a worker thread while the AI pipeline waits on the network
+        # Jobs over the concurrency limit stay "pending" until a slot frees up
+        async with analysis_semaphore:
+            print(f"{log_prefix} Running AI analysis and rule-based stock recommender...")
+            (ai_json_string, citations, cacheable), recommendations_list = await asyncio.gather(
+                run_ai_analysis(ticker, request, log_prefix, _job_streams.get(job_id)),
+                asyncio.to_thread(get_recommendations, request)
+            )
         
         # --- TASK 3: Combine Results ---
-        print(f"[Background Job: {job_id}] Combining results...")
-        
-        ai_data = json.loads(ai_json_string)
-        ai_data['recommendedStocks'] = recommendations_list
-        
-        if citations:
-            citation_header = "\n\n--- Sources ---\n"
-            citation_list = "\n".join(citations)
-            ai_data['analysis'] += citation_header + citation_list
-        
-        final_json_string = json.dumps(ai_data)
+        print(f"{log_prefix} Combining results...")
+        final_json_string = combine_results(ai_json_string, recommendations_list, citations)
         
         # --- TASK 4: Cache and Update Job Status ---
-        set_cached_analysis(ticker, final_json_string)
-        update_job_complete(job_id, final_json_string)
-        print(f"--- [Background Job: {job_id}] Analysis for {ticker} complete. ---")
+        if cacheable:
+            await complete_job_with_cache(job_id, cache_key, final_json_string, request)
+        else:
+            await update_job_complete(job_id, final_json_string)
+        print(f"--- {log_prefix} Analysis for {ticker} complete. ---")
 
     except Exception as e:
         print(f"--- [Background Job: {job_id}] FAILED ---")
         print(f"An unexpected error occurred: {e}")
         import traceback
         traceback.print_exc()
-        update_job_failed(job_id, str(e))
+        await update_job_failed(job_id, str(e))
+
+# Strong references to running jobs; the event loop only keeps weak ones
+_running_jobs = set()
+# cache_key -> job_id of the job currently computing that analysis, so an
+# identical request joins it instead of paying for NewsAPI/Gemini again
+_inflight_jobs = {}
+
+class JobTokenStream:
+    """
+    Fans out a running job's Gemini tokens to /api/stream subscribers.
+    Tokens are kept so late subscribers get a replay from the start.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.subscribers = set()
+        self.closed = False
+
+    def publish(self, text):
+        self.tokens.append(text)
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(text)
+
+    def close(self):
+        self.closed = True
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(None)
+
+    def subscribe(self):
+        subscriber = asyncio.Queue()
+        for text in self.tokens:
+            subscriber.put_nowait(text)
+        if self.closed:
+            subscriber.put_nowait(None)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+_job_streams = {}  # job_id -> JobTokenStream, while the job runs in this process
+
+def start_analysis_job(job_id: str, request: AnalysisRequest, semantic_checked: bool = False):
+    """Schedules run_full_analysis_task on the event loop right away."""
+    cache_key = make_cache_key(request)
+    _inflight_jobs[cache_key] = job_id
+    _job_streams[job_id] = JobTokenStream()
+    
+    def _on_done(task):
+        _running_jobs.discard(task)
+        if _inflight_jobs.get(cache_key) == job_id:
+            del _inflight_jobs[cache_key]
+        _job_streams.pop(job_id).close()
+    
+    task = asyncio.create_task(run_full_analysis_task(job_id, request, semantic_checked))
+    _running_jobs.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+async def submit_analysis_job(request: AnalysisRequest, semantic_checked: bool = False) -> str:
+    """
+    Creates and starts a job for the request and returns its ID. If an
+    identical request is already being analyzed, returns that job's ID.
+    Pass semantic_checked=True if get_cached_analysis(..., request) just missed.
+    """
+    cache_key = make_cache_key(request)
+    job_id = _inflight_jobs.get(cache_key)
+    if job_id is not None:
+        print(f"--- Joining in-flight Job ID: {job_id} ---")
+        return job_id
+    
+    job_id = str(uuid.uuid4())
+    _inflight_jobs[cache_key] = job_id  # claim before awaiting the DB insert
+    try:
+        await create_job(job_id, request)
+    except BaseException:
+        # Otherwise identical requests would keep joining a job that never started
+        if _inflight_jobs.get(cache_key) == job_id:
+            del _inflight_jobs[cache_key]
+        raise
+    start_analysis_job(job_id, request, semantic_checked)
+    return job_id
+
+# Jobs interrupted by a restart are picked up again at startup. A job that
+# keeps killing the process is given up after MAX_JOB_ATTEMPTS.
+MAX_JOB_ATTEMPTS = 3
+
+def _claim_pending_jobs_sync():
+    """
+    Returns (job_id, request_json) for pending jobs, bumping their attempt
+    count. The conditional UPDATE makes sure only one worker claims each job.
+    """
+    claimed = []
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT job_id, request, attempts FROM jobs WHERE status = 'pending' AND request IS NOT NULL"
+        ).fetchall()
+        for job_id, request_json, attempts in rows:
+            if attempts >= MAX_JOB_ATTEMPTS:
+                conn.execute("UPDATE jobs SET status = ?, result = ? WHERE job_id = ?",
+                             ("failed", "Job was interrupted too many times.", job_id))
+                continue
+            cursor = conn.execute(
+                "UPDATE jobs SET attempts = ? WHERE job_id = ? AND attempts = ?",
+                (attempts + 1, job_id, attempts)
+            )
+            if cursor.rowcount == 1:
+                claimed.append((job_id, request_json))
+    return claimed
+
+async def resume_pending_jobs():
+    """Restarts jobs that were still pending when the server last stopped."""
+    try:
+        claimed = await asyncio.to_thread(_claim_pending_jobs_sync)
+    except Exception as e:
+        print(f"Error resuming pending jobs: {e}")
+        return
+    for job_id, request_json in claimed:
+        print(f"--- Resuming interrupted Job ID: {job_id} ---")
+        start_analysis_job(job_id, AnalysisRequest.model_validate_json(request_json))
+
+# --- 5b. Streaming Analysis (Server-Sent Events) ---
+def _sse(payload: dict) -> str:
+    """Formats a payload as a single Server-Sent Events message."""
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+async def stream_job_events(job_id: str):
+    """
+    Yields a job's Gemini tokens as SSE "token" events while it runs in this
+    process, then a "complete" (or "error") event with the final result.
+    """
+    token_stream = _job_streams.get(job_id)
+    if token_stream is not None:
+        subscriber = token_stream.subscribe()
+        try:
+            while True:
+                text = await subscriber.get()
+                if text is None:
+                    break
+                yield _sse({"type": "token", "text": text})
+        finally:
+            token_stream.unsubscribe(subscriber)
+    
+    status = await wait_for_job(job_id)
+    if status["status"] == "complete":
+        yield _sse({"type": "complete", "analysis": status["result"]})
+    else:
+        yield _sse({"type": "error", "error": status["result"] or "Job not found"})
+
+async def stream_analysis_events(request: AnalysisRequest):
+    """
+    Generator behind /api/analyze-stream. Yields Gemini tokens as they arrive
+    ("token" events), then the full combined result ("complete" event).
+    The analysis runs as a background job, so it counts against
+    MAX_CONCURRENT_ANALYSES, identical streams and jobs share one
+    computation, and a client that disconnects doesn't waste the work.
+    """
+    ticker = request.ticker.upper()
+    log_prefix = f"[Stream: {ticker}]"
+    try:
+        cached_result = await get_cached_analysis(make_cache_key(request), request)
+        if cached_result:
+            print(f"{log_prefix} Found cached result.")
+            yield _sse({"type": "complete", "analysis": cached_result})
+            return
+        
+        job_id = await submit_analysis_job(request, semantic_checked=True)
+        print(f"{log_prefix} Streaming Job ID: {job_id}")
+        async for event in stream_job_events(job_id):
+            yield event
+
+    except Exception as e:
+        print(f"--- {log_prefix} FAILED: {e} ---")
+        yield _sse({"type": "error", "error": str(e)})
 
 # --- 6. API Endpoints (UPDATED) ---
 
@@ -267,9 +1211,10 @@ async def health_check():
     return {"status": "healthy"}
 
 @app.post("/api/analyze")
-async def analyze_direct(request: AnalysisRequest, background_tasks: BackgroundTasks):
+async def analyze_direct(request: AnalysisRequest):
     """
-    Real analysis endpoint that processes user inputs
+    Real analysis endpoint that processes user inputs. Runs (or joins) the
+    analysis job and returns its result once it finishes.
     """
     try:
         print(f"=== Starting Real Analysis ===")
@@ -278,56 +1223,48 @@ async def analyze_direct(request: AnalysisRequest, background_tasks: BackgroundT
         print(f"Expected Return: {request.expectedReturn}%")
         
         # Check cache first
-        cached_result = get_cached_analysis(request.ticker)
+        cached_result = await get_cached_analysis(make_cache_key(request), request)
         if cached_result:
             print("Returning cached result")
             return {"analysis": cached_result}
         
-        # Create a job for background processing
-        job_id = str(uuid.uuid4())
-        create_job(job_id)
-        
-        # Start the real analysis in background
-        background_tasks.add_task(run_full_analysis_task, job_id, request)
-        
-        # For now, return a simple response while processing
-        # In a real app, you'd use the job system to check status
-        simple_response = {
-            "analysis": "Analysis started... this may take a moment.",
-            "investmentAdvice": {
-                "summary": "Processing your request",
-                "reasoning": "AI is analyzing your inputs",
-                "riskAssessment": "Calculating..."
-            },
-            "forecastData": [],
-            "recommendedStocks": [],
-            "keyNews": "Fetching latest news..."
-        }
-        
-        return {"analysis": json.dumps(simple_response)}
+        # Start the real analysis in background (or join an identical one)
+        job_id = await submit_analysis_job(request, semantic_checked=True)
+        status = await wait_for_job(job_id)
+        if status["status"] == "complete":
+            return {"analysis": status["result"]}
+        return {"error": status["result"] or "Analysis failed"}
         
     except Exception as e:
         print(f"Error in analyze_direct: {e}")
         return {"error": str(e)}
 
 @app.post("/api/start-analysis", response_model=AnalysisResponse)
-async def start_analysis(request: AnalysisRequest, background_tasks: BackgroundTasks):
+async def start_analysis(request: AnalysisRequest):
     """
     This endpoint creates a new job, starts it in the background,
     and *immediately* returns a job ID to the frontend.
     """
-    job_id = str(uuid.uuid4())
-    print(f"--- Received new request. Creating Job ID: {job_id} ---")
-    
-    # Create the job in the DB
-    create_job(job_id)
-    
-    # Add the long-running task to the background
-    background_tasks.add_task(run_full_analysis_task, job_id, request)
+    # Create the job in the DB and start it in the background,
+    # reusing the job of an identical in-flight request
+    job_id = await submit_analysis_job(request)
+    print(f"--- Received new request. Job ID: {job_id} ---")
     
     # Return the Job ID to the frontend
     return {"jobId": job_id}
 
+@app.post("/api/analyze-stream")
+async def analyze_stream(request: AnalysisRequest):
+    """
+    Streams the analysis as Server-Sent Events so the frontend can start
+    rendering after the first Gemini token instead of waiting for the full response.
+    """
+    print(f"--- Received streaming request for {request.ticker} ---")
+    return StreamingResponse(
+        stream_analysis_events(request),
+        media_type="text/event-stream"
+    )
+
 @app.get("/api/status/{job_id}", response_model=StatusResponse)
 async def get_analysis_status(job_id: str):
     """
@@ -335,14 +1272,72 @@ async def get_analysis_status(job_id: str):
     to check if the job is "pending", "complete", or "failed".
     """
     print(f"--- Received status check for Job ID: {job_id} ---")
-    status = get_job_status(job_id)
+    status = await get_job_status(job_id)
     return status
 
+@app.get("/api/stream/{job_id}")
+async def stream_job(job_id: str):
+    """
+    Streams a background job as Server-Sent Events: Gemini "token" events
+    while it runs, then a "complete" (or "error") event with the final result.
+    Jobs running in another worker only get the final event.
+    """
+    return StreamingResponse(stream_job_events(job_id), media_type="text/event-stream")
+
+@app.websocket("/api/ws/status/{job_id}")
+async def job_status_websocket(websocket: WebSocket, job_id: str):
+    """
+    Push alternative to polling /api/status: sends the final job status
+    once the job completes or fails, then closes.
+    """
+    await websocket.accept()
+    # Watch for a disconnect too, so a client that leaves doesn't hold the wait
+    wait_task = asyncio.create_task(wait_for_job(job_id))
+    disconnect_task = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        await asyncio.wait({wait_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+        if wait_task.done():
+            await websocket.send_json(wait_task.result())
+            await websocket.close()
+        else:
+            print(f"--- Status WebSocket for Job ID {job_id} disconnected ---")
+    except WebSocketDisconnect:
+        print(f"--- Status WebSocket for Job ID {job_id} disconnected ---")
+    finally:
+        wait_task.cancel()
+        disconnect_task.cancel()
+
+@app.get("/api/sse/status/{job_id}")
+async def job_status_sse(job_id: str):
+    """
+    Server-Sent Events fallback for clients that can't use WebSockets.
+    """
+    async def events():
+        status = await wait_for_job(job_id)
+        yield _sse(status)
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # --- 7. Run the Server ---
 if __name__ == "__main__":
     print("--- Starting FastAPI server ---")
     port = int(os.environ.get("PORT", 8000))
     host = os.environ.get("HOST", "0.0.0.0") 
-    print(f"--- Running on http://{host}:{port} ---")
-    uvicorn.run("api_server:app", host=host, port=port, reload=False)
+    
+    # Extra workers only help once the cache is shared between processes;
+    # with SQLite they would just contend for the same write lock.
+    workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+    if workers > 1 and (CACHE_BACKEND != "redis" or aioredis is None):
+        print("--- WEB_CONCURRENCY > 1 requires CACHE_BACKEND=redis; using 1 worker ---")
+        workers = 1
+    
+    print(f"--- Running on http://{host}:{port} with {workers} worker(s) ---")
+    uvicorn.run(
+        "api_server:app",
+        host=host,
+        port=port,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+        workers=workers
+    )
 
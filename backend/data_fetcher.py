@@ -1,21 +1,41 @@
 import yfinance as yf
-import requests
+import httpx
+import asyncio
 import re
 import sys
 import os
+import glob
+import pickle
+import threading
+import time
+import orjson
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from functools import lru_cache
+from hashlib import blake2b
 
 # --- Import ML/Vector libraries ---
 try:
     from sentence_transformers import SentenceTransformer
+    import torch
     import faiss
     import numpy as np
     import nltk
     from nltk.tokenize import sent_tokenize
+    try:
+        from nltk.tokenize import PunktTokenizer
+    except ImportError:  # nltk < 3.8.2
+        PunktTokenizer = None
 except ImportError as e:
     print(f"Error: Missing required libraries: {e}")
     print("Please run: pip install sentence-transformers faiss-cpu numpy nltk")
     sys.exit(1)
 
+# FAISS defaults to one OpenMP thread per logical core, which oversubscribes
+# the CPU alongside the torch encoder and the request threads
+FAISS_THREADS = int(os.environ.get("FAISS_THREADS", min(8, os.cpu_count() or 1)))
+faiss.omp_set_num_threads(FAISS_THREADS)
+
 # --- Download NLTK data (one-time) ---
 def download_nltk_data():
     """
@@ -33,9 +53,60 @@ def download_nltk_data():
         except Exception as e:
             print(f"Warning: Could not download NLTK data: {e}")
 
+# Since nltk 3.8.2, sent_tokenize() builds a new PunktTokenizer (loading its
+# parameters from disk) on every call. One instance is created on first use
+# and reused, and results are cached since the same summaries and articles
+# come back on every analysis of a ticker.
+_punkt_tokenizer = None
+
+@lru_cache(maxsize=1024)
+def split_sentences(text):
+    """Returns the sentences of text as a tuple."""
+    global _punkt_tokenizer
+    if PunktTokenizer is None:
+        return tuple(sent_tokenize(text))
+    if _punkt_tokenizer is None:
+        _punkt_tokenizer = PunktTokenizer()
+    return tuple(_punkt_tokenizer.tokenize(text))
+
 # --- Global var to hold the embedding model ---
 embedding_model = None
 
+# Set EMBEDDING_QUANTIZE=0 to keep the CPU model in full fp32
+EMBEDDING_QUANTIZE = os.environ.get("EMBEDDING_QUANTIZE", "1") == "1"
+# Set EMBEDDING_BF16=1 on CPUs with native bfloat16 (Sapphire Rapids, Zen 4)
+# to run the model under bf16 autocast instead of int8 quantization
+EMBEDDING_BF16 = os.environ.get("EMBEDDING_BF16", "0") == "1"
+
+# "torch" (default) or "onnx". The ONNX backend runs one of the exports
+# shipped with all-MiniLM-L6-v2 through onnxruntime:
+#   onnx/model_qint8_avx512_vnni.onnx  int8, fastest on recent x86 CPUs
+#   onnx/model_qint8_avx2.onnx         int8, older x86 CPUs
+#   onnx/model_O3.onnx                 fp32 with fused attention/GELU graphs,
+#                                      for when int8 recall isn't acceptable
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+# Threads per ONNX inference; 0 lets onnxruntime use every core
+EMBEDDING_ONNX_THREADS = int(os.environ.get("EMBEDDING_ONNX_THREADS", 0))
+# News descriptions and 3-sentence chunks fit well within 128 tokens;
+# MiniLM's default of 256 only adds attention cost on the rare long chunk
+EMBEDDING_MAX_SEQ_LENGTH = int(os.environ.get("EMBEDDING_MAX_SEQ_LENGTH", 128))
+
+def _prepare_for_inference(model):
+    """
+    Switches the model to eval mode and shrinks it for inference:
+    fp16 weights on CUDA, int8 dynamic quantization of Linear layers on CPU
+    (unless bf16 autocast is enabled).
+    """
+    model.eval()
+    if torch.cuda.is_available():
+        return model.half()
+    if EMBEDDING_QUANTIZE and not EMBEDDING_BF16:
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return model
+
 def load_embedding_model():
     """Loads the sentence transformer model into the global variable."""
     global embedding_model
@@ -43,19 +114,118 @@ def load_embedding_model():
         print("Loading embedding model...")
         try:
             # Using a small, fast, and effective model
-            embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-            print("Embedding model loaded successfully.")
+            if EMBEDDING_BACKEND == "onnx":
+                # Already int8-quantized; needs sentence-transformers[onnx]
+                model_kwargs = {"file_name": EMBEDDING_ONNX_FILE, "provider": "CPUExecutionProvider"}
+                if EMBEDDING_ONNX_THREADS:
+                    import onnxruntime
+                    session_options = onnxruntime.SessionOptions()
+                    session_options.intra_op_num_threads = EMBEDDING_ONNX_THREADS
+                    model_kwargs["session_options"] = session_options
+                embedding_model = SentenceTransformer(
+                    'all-MiniLM-L6-v2',
+                    backend="onnx",
+                    model_kwargs=model_kwargs
+                )
+            else:
+                model = SentenceTransformer('all-MiniLM-L6-v2')
+                embedding_model = _prepare_for_inference(model)
+            embedding_model.max_seq_length = EMBEDDING_MAX_SEQ_LENGTH
+            print(f"Embedding model loaded successfully ({EMBEDDING_BACKEND} backend).")
         except Exception as e:
             print(f"Error loading embedding model: {e}")
             # Don't exit, just return None and let calling code handle it
     return embedding_model
 
+def encode_texts(texts, **kwargs):
+    """
+    Encodes texts with the shared embedding model under torch.inference_mode(),
+    which skips autograd bookkeeping entirely.
+    """
+    if embedding_model is None:
+        raise RuntimeError("Embedding model not loaded.")
+    with torch.inference_mode(), _autocast():
+        return embedding_model.encode(texts, show_progress_bar=False, **kwargs)
+
+def warm_up_embedding_model():
+    """
+    Runs one throwaway encode so lazy initialization (kernel selection,
+    ONNX session setup, Punkt loading) happens before the first request.
+    """
+    if embedding_model is None:
+        return
+    try:
+        split_sentences("Warm-up sentence. Another one.")
+        encode_texts(["warm-up"], normalize_embeddings=True)
+    except Exception as e:
+        print(f"Warning: Embedding model warm-up failed: {e}")
+
+def _autocast():
+    if EMBEDDING_BF16 and EMBEDDING_BACKEND == "torch" and not torch.cuda.is_available():
+        return torch.autocast(device_type='cpu', dtype=torch.bfloat16)
+    return nullcontext()
+
 # --- 1. Data Fetching ---
 
+# Shared HTTP client so NewsAPI calls reuse pooled keep-alive connections
+# instead of paying a TCP + TLS handshake each time. Opened and closed by
+# the FastAPI lifespan handler.
+http_client = None
+
+async def open_http_client():
+    global http_client
+    if http_client is None:
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=2,  # retries failed connection attempts only
+            # Keep idle connections for a minute so requests spaced out by
+            # users' think time still skip the TCP + TLS handshake
+            limits=httpx.Limits(
+                max_connections=64,
+                max_keepalive_connections=20,
+                keepalive_expiry=60
+            )
+        )
+        http_client = httpx.AsyncClient(transport=transport, timeout=10)
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+# yfinance's ticker.info costs several round trips to Yahoo; fundamentals
+# barely move within the analysis cache window, so successful lookups are
+# reused for FUNDAMENTALS_CACHE_TTL seconds.
+FUNDAMENTALS_CACHE_TTL = int(os.environ.get("FUNDAMENTALS_CACHE_TTL", 1800))
+FUNDAMENTALS_CACHE_SIZE = 256
+_fundamentals_cache = OrderedDict()  # ticker -> (timestamp, (fundamentals, summary))
+_fundamentals_cache_lock = threading.Lock()
+
 def get_fundamentals(ticker_symbol):
     """
-    Fetches fundamental stock data using yfinance.
+    Fetches fundamental stock data using yfinance, with a short-lived
+    in-process cache.
     """
+    key = ticker_symbol.upper()
+    with _fundamentals_cache_lock:
+        entry = _fundamentals_cache.get(key)
+        if entry is not None and (time.time() - entry[0]) < FUNDAMENTALS_CACHE_TTL:
+            _fundamentals_cache.move_to_end(key)
+            fundamentals, summary = entry[1]
+            return dict(fundamentals), summary
+    
+    fundamentals, summary = _fetch_fundamentals(ticker_symbol)
+    if fundamentals:
+        with _fundamentals_cache_lock:
+            _fundamentals_cache[key] = (time.time(), (dict(fundamentals), summary))
+            _fundamentals_cache.move_to_end(key)
+            while len(_fundamentals_cache) > FUNDAMENTALS_CACHE_SIZE:
+                _fundamentals_cache.popitem(last=False)
+    return fundamentals, summary
+
+def _fetch_fundamentals(ticker_symbol):
     try:
         ticker = yf.Ticker(ticker_symbol)
         info = ticker.info
@@ -85,7 +255,46 @@ def get_fundamentals(ticker_symbol):
         # Return empty but valid data instead of None
         return {}, "No fundamental data available."
 
-def get_news(ticker_symbol, api_key, num_articles=10):  # Reduced from 20 to 10
+class AsyncRateLimiter:
+    """
+    Allows at most max_rate acquisitions per time_period seconds (sliding
+    window); callers over the limit wait for the oldest slot to free up.
+    """
+
+    def __init__(self, max_rate, time_period=60):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._calls = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.time_period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_rate:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(self.time_period - (now - self._calls[0]))
+
+# Keeps bursts of analyses from tripping NewsAPI's 429s
+NEWSAPI_RATE_LIMIT = int(os.environ.get("NEWSAPI_RATE_LIMIT", 30))  # requests per minute
+newsapi_limiter = AsyncRateLimiter(NEWSAPI_RATE_LIMIT, 60)
+
+# Rate limiting and transient server errors are retried with backoff
+NEWSAPI_RETRIES = 2
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+async def _get_with_retries(client, url, params):
+    for attempt in range(NEWSAPI_RETRIES + 1):
+        await newsapi_limiter.acquire()
+        response = await client.get(url, params=params)
+        if response.status_code not in RETRY_STATUSES or attempt == NEWSAPI_RETRIES:
+            return response
+        await asyncio.sleep(0.3 * 2 ** attempt)
+
+async def get_news(ticker_symbol, api_key, num_articles=10):  # Reduced from 20 to 10
     """
     Fetches recent news articles from NewsAPI.org.
     """
@@ -103,28 +312,237 @@ def get_news(ticker_symbol, api_key, num_articles=10):  # Reduced from 20 to 10
     }
     
     try:
-        response = requests.get(base_url, params=params, timeout=10)
+        if http_client is not None:
+            response = await _get_with_retries(http_client, base_url, params)
+        else:
+            # Called outside the server (no lifespan): use a one-off client
+            async with httpx.AsyncClient(timeout=10) as client:
+                response = await _get_with_retries(client, base_url, params)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
         if data.get('status') == 'ok':
-            articles = data.get('articles', [])
+            # Syndicated stories often come back more than once; keep the first copy
+            articles = []
+            seen_urls = set()
+            for article in data.get('articles', []):
+                url = article.get('url')
+                if url:
+                    if url in seen_urls:
+                        continue
+                    seen_urls.add(url)
+                # Keep only the fields process_and_embed() uses, so the raw
+                # response tree can be freed right away
+                articles.append({
+                    'source': (article.get('source') or {}).get('name') or 'Unknown',
+                    'publishedAt': article.get('publishedAt') or 'Unknown',
+                    'url': url or '#',
+                    'text': article.get('description') or article.get('content') or '',
+                })
+            del data
             print(f"Found {len(articles)} news articles for {ticker_symbol}")
             return articles
         else:
             print(f"NewsAPI error: {data.get('message', 'Unknown error')}")
             return []
             
-    except requests.exceptions.RequestException as e:
+    except (httpx.HTTPError, orjson.JSONDecodeError) as e:
         print(f"Error fetching news for {ticker_symbol}: {e}")
         return []
 
 # --- 2. RAG Processing ---
 
+# Below this many vectors an exact flat index is both fastest and smallest;
+# IVF-PQ also needs roughly 256 * 39 points to train its 8-bit codebooks.
+IVF_PQ_MIN_VECTORS = 10000
+# Between this and IVF_PQ_MIN_VECTORS, an HNSW graph gives sublinear search
+# for about 1.5x the build cost of a flat index
+HNSW_MIN_VECTORS = int(os.environ.get("HNSW_MIN_VECTORS", 2000))
+HNSW_M = 32
+
+def _pq_subquantizers(dimension):
+    """Picks a PQ sub-quantizer count that evenly divides the dimension."""
+    for m in (64, 48, 32, 16, 8, 4):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def build_vector_index(embeddings):
+    """
+    Builds an inner-product FAISS index for the given unit-normalized float32
+    embeddings (so scores are cosine similarities).
+    Small corpora get an exact IndexFlatIP, mid-sized ones an HNSW graph,
+    and large ones a trained IVF-PQ index, which stores compressed codes
+    instead of the raw vectors.
+    """
+    num_vectors, dimension = embeddings.shape
+    if num_vectors < HNSW_MIN_VECTORS:
+        index = faiss.IndexFlatIP(dimension)
+    elif num_vectors < IVF_PQ_MIN_VECTORS:
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 40
+        index.hnsw.efSearch = 16
+    else:
+        nlist = max(1, min(int(np.sqrt(num_vectors)), num_vectors // 39))
+        m = _pq_subquantizers(dimension)
+        index = faiss.index_factory(dimension, f"IVF{nlist},PQ{m}", faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+        faiss.extract_index_ivf(index).nprobe = min(16, nlist)
+    index.add(embeddings)
+    return index
+
+# --- On-disk index cache ---
+# Indices are persisted per (ticker, news set, business summary) so a repeat
+# request for the same content skips chunking, embedding and index
+# construction entirely. Files older than FAISS_CACHE_TTL are rebuilt.
+FAISS_CACHE_DIR = os.environ.get("FAISS_CACHE_DIR", os.path.join("cache", "faiss"))
+FAISS_CACHE_MAX_FILES = int(os.environ.get("FAISS_CACHE_MAX_FILES", 64))
+FAISS_CACHE_TTL = int(os.environ.get("FAISS_CACHE_TTL", 3600))
+
+def content_hash(news_articles, summary_text):
+    """Short digest identifying the content an index is built from."""
+    # Sorted so the same articles in a different order hit the same entry
+    urls = "\n".join(sorted(article.get('url') or '' for article in news_articles))
+    return blake2b((urls + "\n\n" + (summary_text or '')).encode()).hexdigest()[:16]
+
+# Bump when the index format changes so stale files are never loaded
+# (v2: normalized embeddings, inner-product metric; v3: 128-token inputs)
+FAISS_CACHE_VERSION = 3
+
+def _index_cache_paths(ticker, news_hash):
+    base = os.path.join(FAISS_CACHE_DIR, f"{ticker}-{news_hash}-v{FAISS_CACHE_VERSION}")
+    return base + ".index", base + ".pkl"
+
+def _load_cached_index(ticker, news_hash):
+    """Returns (index, text_chunks, metadata) from disk, or None on a miss."""
+    index_path, meta_path = _index_cache_paths(ticker, news_hash)
+    if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+        return None
+    if time.time() - os.path.getmtime(index_path) >= FAISS_CACHE_TTL:
+        return None
+    try:
+        try:
+            # mmap the file instead of copying it into RAM where FAISS supports it
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = faiss.read_index(index_path)
+        with open(meta_path, 'rb') as f:
+            text_chunks, metadata = pickle.load(f)
+        return index, text_chunks, metadata
+    except Exception as e:
+        print(f"Warning: Could not load cached FAISS index {index_path}: {e}")
+        return None
+
+def _evict_cached_indices():
+    """Keeps only the FAISS_CACHE_MAX_FILES most recently written indices."""
+    index_files = sorted(
+        glob.glob(os.path.join(FAISS_CACHE_DIR, "*.index")),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for index_path in index_files[FAISS_CACHE_MAX_FILES:]:
+        for path in (index_path, index_path[:-len(".index")] + ".pkl"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def _save_cached_index(ticker, news_hash, index, text_chunks, metadata):
+    index_path, meta_path = _index_cache_paths(ticker, news_hash)
+    try:
+        os.makedirs(FAISS_CACHE_DIR, exist_ok=True)
+        # Write to temp files and rename so readers never see partial files
+        with open(meta_path + ".tmp", 'wb') as f:
+            pickle.dump((text_chunks, metadata), f, protocol=pickle.HIGHEST_PROTOCOL)
+        faiss.write_index(index, index_path + ".tmp")
+        os.replace(meta_path + ".tmp", meta_path)
+        os.replace(index_path + ".tmp", index_path)
+        _evict_cached_indices()
+    except Exception as e:
+        print(f"Warning: Could not persist FAISS index {index_path}: {e}")
+
+# --- In-memory index cache ---
+# Sits in front of the disk cache: repeat analyses of a ticker within the
+# news refresh window reuse the loaded index without touching disk.
+EMBED_CACHE_TTL = int(os.environ.get("EMBED_CACHE_TTL", 3600))
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", 32))
+_embed_cache = OrderedDict()  # (ticker, news_hash) -> (timestamp, (index, text_chunks, metadata))
+_embed_cache_lock = threading.Lock()
+
+def _embed_cache_get(key):
+    with _embed_cache_lock:
+        entry = _embed_cache.get(key)
+        if entry is None:
+            return None
+        timestamp, result = entry
+        if (time.time() - timestamp) >= EMBED_CACHE_TTL:
+            del _embed_cache[key]
+            return None
+        _embed_cache.move_to_end(key)
+        return result
+
+def _embed_cache_put(key, result):
+    with _embed_cache_lock:
+        _embed_cache[key] = (time.time(), result)
+        _embed_cache.move_to_end(key)
+        while len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+
+# --- Chunk embedding store ---
+# Market-wide stories show up in the news for many tickers. Embeddings are
+# kept per chunk digest so only chunks not seen before are encoded.
+CHUNK_EMBED_CACHE_SIZE = int(os.environ.get("CHUNK_EMBED_CACHE_SIZE", 10000))
+_chunk_embeddings = OrderedDict()  # chunk digest -> 1-D float32 embedding
+_chunk_embeddings_lock = threading.Lock()
+
+def _chunk_embeddings_get(digests):
+    """Returns a list with the stored embedding (or None) for each digest."""
+    with _chunk_embeddings_lock:
+        vectors = []
+        for digest in digests:
+            vector = _chunk_embeddings.get(digest)
+            if vector is not None:
+                _chunk_embeddings.move_to_end(digest)
+            vectors.append(vector)
+        return vectors
+
+def _chunk_embeddings_put(digests, vectors):
+    with _chunk_embeddings_lock:
+        for digest, vector in zip(digests, vectors):
+            _chunk_embeddings[digest] = vector
+            _chunk_embeddings.move_to_end(digest)
+        while len(_chunk_embeddings) > CHUNK_EMBED_CACHE_SIZE:
+            _chunk_embeddings.popitem(last=False)
+
+# NewsAPI truncates content with a "[+1234 chars]" suffix
+_TRUNCATION_MARKER_RE = re.compile(r'\[\+\d+ chars\]$')
+_WHITESPACE_RE = re.compile(r'\s+')
+# News blurbs are short, machine-written text; a boundary regex splits them
+# well enough. Punkt is kept for the business summary (abbreviations etc.).
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+# Articles shorter than this become a single chunk without splitting
+SHORT_CONTENT_CHARS = 200
+
+# Larger batches only pay off on a GPU; on CPU they just add padding
+ENCODE_BATCH_SIZE = 128 if torch.cuda.is_available() else 64
+
 def process_and_embed(news_articles, summary_text, ticker=""):
     """
     Processes text into chunks, creates embeddings, and builds a FAISS index.
+    Indices are cached in memory and on disk per (ticker, news URLs, summary)
+    and reused when possible.
     """
+    news_hash = content_hash(news_articles, summary_text)
+    if ticker:
+        cached = _embed_cache_get((ticker, news_hash))
+        if cached is not None:
+            return cached
+        cached = _load_cached_index(ticker, news_hash)
+        if cached is not None:
+            print(f"Loaded cached FAISS index for {ticker} ({cached[0].ntotal} vectors).")
+            _embed_cache_put((ticker, news_hash), cached)
+            return cached
+    
     if embedding_model is None:
         load_embedding_model()
     
@@ -134,16 +552,29 @@ def process_and_embed(news_articles, summary_text, ticker=""):
         
     text_chunks = []
     metadata = []
+    seen_chunks = set()  # digests of chunks already added
+    chunk_digests = []  # digest per entry of text_chunks
+    
+    def add_chunk(chunk, meta):
+        # Identical chunks waste an encode and crowd out other top-k results
+        digest = blake2b(chunk.encode(), digest_size=16).digest()
+        if digest in seen_chunks:
+            return
+        seen_chunks.add(digest)
+        chunk_digests.append(digest)
+        # Built once here so retrieval doesn't format it on every query
+        meta['citation'] = "[%s](%s) - %s" % (meta['source'], meta['url'], meta['date'])
+        text_chunks.append(chunk)
+        metadata.append(meta)
     
     # --- 1. Process the summary text ---
     if summary_text and summary_text != 'No summary available.':
         try:
-            summary_sentences = sent_tokenize(summary_text)
+            summary_sentences = split_sentences(summary_text)
             # Create chunks of 3 sentences
             for i in range(0, len(summary_sentences), 3):
                 chunk = " ".join(summary_sentences[i:i+3])
-                text_chunks.append(chunk)
-                metadata.append({
+                add_chunk(chunk, {
                     'source': f"{ticker} Business Summary",
                     'date': 'N/A',
                     'url': '#'
@@ -154,26 +585,30 @@ def process_and_embed(news_articles, summary_text, ticker=""):
     # --- 2. Process news articles ---
     for article in news_articles:
         try:
-            content = article.get('description', '') or article.get('content', '')
+            content = article['text']
             if not content:
                 continue
             
             # Clean up the text
-            content = re.sub(r'\[\+\d+ chars\]$', '', content)
-            content = re.sub(r'\s+', ' ', content).strip()
+            content = _TRUNCATION_MARKER_RE.sub('', content)
+            content = _WHITESPACE_RE.sub(' ', content).strip()
             
             if not content:
                 continue
-                
-            sentences = sent_tokenize(content)
+            
+            # Most descriptions are a single short sentence: keep them whole
+            # instead of splitting and re-joining
+            if len(content) < SHORT_CONTENT_CHARS or '.' not in content[:-1]:
+                sentences = [content]
+            else:
+                sentences = _SENTENCE_BOUNDARY_RE.split(content)
             # Create smaller chunks for memory efficiency
             for i in range(0, len(sentences), 3):  # Reduced from 4 to 3
                 chunk = " ".join(sentences[i:i+3])
-                text_chunks.append(chunk)
-                metadata.append({
-                    'source': article.get('source', {}).get('name', 'Unknown'),
-                    'date': article.get('publishedAt', 'Unknown')[:10],
-                    'url': article.get('url', '#')
+                add_chunk(chunk, {
+                    'source': article['source'],
+                    'date': article['publishedAt'][:10],
+                    'url': article['url']
                 })
         except Exception as e:
             print(f"Error processing news article: {e}")
@@ -185,24 +620,37 @@ def process_and_embed(news_articles, summary_text, ticker=""):
         return None, [], []
 
     try:
-        print(f"Creating embeddings for {len(text_chunks)} text chunks...")
-        
-        # Process in smaller batches to avoid memory issues
-        batch_size = 32
-        all_embeddings = []
-        
-        for i in range(0, len(text_chunks), batch_size):
-            batch = text_chunks[i:i+batch_size]
-            batch_embeddings = embedding_model.encode(batch, show_progress_bar=False)
-            all_embeddings.append(batch_embeddings)
+        # Rows are written straight into one contiguous float32 buffer that
+        # FAISS can use as-is, instead of stacking and casting copies
+        dimension = embedding_model.get_sentence_embedding_dimension()
+        embeddings = np.empty((len(text_chunks), dimension), dtype=np.float32)
+        missing = []
+        for i, vector in enumerate(_chunk_embeddings_get(chunk_digests)):
+            if vector is None:
+                missing.append(i)
+            else:
+                embeddings[i] = vector
+        print(f"Creating embeddings for {len(missing)} of {len(text_chunks)} text chunks...")
         
-        embeddings = np.vstack(all_embeddings).astype('float32')
+        if missing:
+            # One encode call; the model batches internally and already sorts
+            # inputs by length to minimize padding. Unit-normalized so the
+            # inner-product index scores cosine similarity.
+            new_embeddings = encode_texts(
+                [text_chunks[i] for i in missing],
+                batch_size=ENCODE_BATCH_SIZE,
+                normalize_embeddings=True,
+                convert_to_numpy=True
+            ).astype(np.float32, copy=False)
+            embeddings[missing] = new_embeddings
+            _chunk_embeddings_put([chunk_digests[i] for i in missing], new_embeddings)
         
-        dimension = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(embeddings)
+        index = build_vector_index(embeddings)
         
         print(f"FAISS index built with {index.ntotal} vectors.")
+        if ticker:
+            _save_cached_index(ticker, news_hash, index, text_chunks, metadata)
+            _embed_cache_put((ticker, news_hash), (index, text_chunks, metadata))
         return index, text_chunks, metadata
         
     except Exception as e:
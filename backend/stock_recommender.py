@@ -3,32 +3,40 @@ Stock Recommendation System Module
 Simplified version for production deployment
 """
 
+import heapq
+import os
 import re
+import sqlite3
+import threading
+import orjson
 import yfinance as yf
 import pandas as pd
 import numpy as np
+from datetime import date
 from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Simplified import - remove relative import
 from data_fetcher import get_fundamentals
 
 # --- Stock Universe: Smaller set for production ---
-POPULAR_STOCKS = [
-    # Technology
-    'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 'NVDA', 'TSLA', 'NFLX', 'AMD', 'INTC',
-    # Finance
-    'JPM', 'BAC', 'WFC', 'GS', 'V', 'MA',
-    # Healthcare
-    'JNJ', 'PFE', 'UNH', 'ABT', 'MRK', 'LLY',
-    # Consumer
-    'WMT', 'HD', 'MCD', 'SBUX', 'NKE', 'COST',
-    # Industrial
-    'BA', 'CAT', 'HON',
-    # Energy
-    'XOM', 'CVX',
-    # Communication
-    'T', 'VZ', 'DIS'
-]
+# Grouped by sector (same names as SECTOR_KEYWORDS) so candidates can be
+# filtered before any network call
+STOCKS_BY_SECTOR = {
+    'Technology': ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 'NVDA', 'TSLA', 'NFLX', 'AMD', 'INTC'],
+    'Finance': ['JPM', 'BAC', 'WFC', 'GS', 'V', 'MA'],
+    'Healthcare': ['JNJ', 'PFE', 'UNH', 'ABT', 'MRK', 'LLY'],
+    'Consumer': ['WMT', 'HD', 'MCD', 'SBUX', 'NKE', 'COST'],
+    'Industrial': ['BA', 'CAT', 'HON'],
+    'Energy': ['XOM', 'CVX'],
+    'Communication': ['T', 'VZ', 'DIS'],
+}
+POPULAR_STOCKS = [ticker for tickers in STOCKS_BY_SECTOR.values() for ticker in tickers]
+STOCK_SECTORS = {ticker: sector for sector, tickers in STOCKS_BY_SECTOR.items() for ticker in tickers}
+# For membership tests; POPULAR_STOCKS keeps the ordering
+POPULAR_STOCKS_SET = frozenset(POPULAR_STOCKS)
+# Runs of letters in the upper-cased text; candidates for tickers
+_WORD_RE = re.compile(r'[A-Z]+')
 
 # --- Sector Mapping ---
 SECTOR_KEYWORDS = {
@@ -41,6 +49,39 @@ SECTOR_KEYWORDS = {
     'Communication': ['telecom', 'communication', 'media']
 }
 
+# Keyword -> sector, and one alternation over every keyword so a single
+# scan of the text finds all sector mentions. Keywords match at the start
+# of a word ('tech' matches 'technology' but 'ai' no longer matches
+# 'retail'); longer keywords are tried first.
+_KW_TO_SECTOR = {kw: sector for sector, kws in SECTOR_KEYWORDS.items() for kw in kws}
+_SECTOR_RE = re.compile(
+    r'\b(' + '|'.join(map(re.escape, sorted(_KW_TO_SECTOR, key=len, reverse=True))) + r')'
+)
+
+# --- Preference Keywords ---
+# One named group per label; earlier labels win when several are present
+_INVESTMENT_TYPE_RE = re.compile(
+    r'(?P<growth>growth|growing)'
+    r'|(?P<value>value|undervalued|cheap)'
+    r'|(?P<dividend>dividend|income|yield)'
+)
+_HOLDING_PERIOD_RE = re.compile(
+    r'(?P<long>long term|long-term|hold)'
+    r'|(?P<short>short term|short-term|trade|trading)'
+)
+
+# Score bonus per risk tolerance (simplified risk matching)
+RISK_TOLERANCE_BONUS = {'Low': 0.1, 'Medium': 0.0, 'High': 0.3}
+# Bonus when the trading history mentions any sector
+SECTOR_MATCH_BONUS = 0.2
+
+# --- Fetch concurrency ---
+# Each fetch is a blocking yfinance request that releases the GIL while it
+# waits on the network, so a thread pool overlaps them.
+RECOMMENDER_WORKERS = int(os.environ.get("RECOMMENDER_WORKERS", 8))
+# Seconds to wait for one ticker before it is skipped
+FETCH_TIMEOUT = 15
+
 # --- Risk Level Mapping ---
 RISK_LEVELS = {
     'Low': {'pe_range': (0, 20), 'volatility_preference': 'low', 'dividend_preference': 'high'},
@@ -49,6 +90,15 @@ RISK_LEVELS = {
 }
 
 
+def _first_label(pattern, text: str) -> Optional[str]:
+    """Returns the highest-priority group name of pattern found in text, or None."""
+    found = {m.lastgroup for m in pattern.finditer(text)}
+    for label in pattern.groupindex:
+        if label in found:
+            return label
+    return None
+
+
 def parse_trading_history(trading_history: str) -> Dict:
     """
     Parses natural language trading history to extract preferences.
@@ -63,34 +113,23 @@ def parse_trading_history(trading_history: str) -> Dict:
         'preferences': {}
     }
     
-    # Extract stock tickers
-    ticker_pattern = r'\b[A-Z]{1,5}\b'
-    potential_tickers = re.findall(ticker_pattern, trading_history.upper())
-    for ticker in potential_tickers:
-        if ticker in POPULAR_STOCKS:
-            if ticker not in parsed['tickers']:
-                parsed['tickers'].append(ticker)
-    
-    # Identify sectors mentioned
-    for sector, keywords in SECTOR_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in text:
-                if sector not in parsed['sectors']:
-                    parsed['sectors'].append(sector)
-                break
+    # Extract stock tickers: distinct words (first-mention order) that are
+    # in the universe. Every ticker in it is 1-5 letters, so no length check.
+    words = dict.fromkeys(_WORD_RE.findall(trading_history.upper()))
+    parsed['tickers'] = [word for word in words if word in POPULAR_STOCKS_SET]
+    
+    # Identify sectors mentioned (kept in SECTOR_KEYWORDS order)
+    mentioned = {_KW_TO_SECTOR[m.group(1)] for m in _SECTOR_RE.finditer(text)}
+    parsed['sectors'] = [sector for sector in SECTOR_KEYWORDS if sector in mentioned]
     
     # Identify preferences
-    if any(word in text for word in ['growth', 'growing', 'growth stock']):
-        parsed['preferences']['type'] = 'growth'
-    elif any(word in text for word in ['value', 'undervalued', 'cheap']):
-        parsed['preferences']['type'] = 'value'
-    elif any(word in text for word in ['dividend', 'income', 'yield']):
-        parsed['preferences']['type'] = 'dividend'
-    
-    if any(word in text for word in ['long term', 'long-term', 'hold', 'holding']):
-        parsed['preferences']['holding_period'] = 'long'
-    elif any(word in text for word in ['short term', 'short-term', 'trade', 'trading']):
-        parsed['preferences']['holding_period'] = 'short'
+    investment_type = _first_label(_INVESTMENT_TYPE_RE, text)
+    if investment_type:
+        parsed['preferences']['type'] = investment_type
+    
+    holding_period = _first_label(_HOLDING_PERIOD_RE, text)
+    if holding_period:
+        parsed['preferences']['holding_period'] = holding_period
     
     return parsed
 
@@ -103,10 +142,89 @@ def get_stock_universe(candidate_count: int = 50) -> List[str]:  # Reduced from
     return POPULAR_STOCKS[:min(candidate_count, len(POPULAR_STOCKS))]
 
 
+def prefilter_candidates(candidates: List[str], sectors: List[str], min_count: int) -> List[str]:
+    """
+    Narrows the candidates to the sectors from the trading history before
+    anything is fetched. Stocks in those sectors come from the whole
+    universe; if there are fewer than min_count, the list is topped up
+    with other candidates in order.
+    """
+    if not sectors:
+        return candidates
+    in_sector = [ticker for ticker in POPULAR_STOCKS if STOCK_SECTORS[ticker] in sectors]
+    chosen = set(in_sector)
+    others = [ticker for ticker in candidates if ticker not in chosen]
+    return in_sector + others[:max(0, min_count - len(in_sector))]
+
+
+# --- Per-day stock data cache ---
+# Candidate data is persisted per (ticker, day), so repeated recommendation
+# runs on the same day (and restarts) skip Yahoo entirely. One connection
+# is shared by the fetch threads behind a lock; each statement is short.
+# Lives under the (git-ignored) cache directory next to the FAISS indices.
+STOCK_CACHE_DB = os.environ.get("STOCK_CACHE_DB", os.path.join("cache", "stock_cache.db"))
+_stock_cache_conn = None
+_stock_cache_lock = threading.Lock()
+
+def _get_stock_cache_conn():
+    """Opens the cache database on first use. Caller holds _stock_cache_lock."""
+    global _stock_cache_conn
+    if _stock_cache_conn is None:
+        os.makedirs(os.path.dirname(STOCK_CACHE_DB) or ".", exist_ok=True)
+        conn = sqlite3.connect(STOCK_CACHE_DB, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stock_cache (
+                ticker TEXT NOT NULL,
+                cache_date TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (ticker, cache_date)
+            )
+        ''')
+        _stock_cache_conn = conn
+    return _stock_cache_conn
+
+def _stock_cache_get(ticker: str, cache_date: str) -> Optional[Dict]:
+    try:
+        with _stock_cache_lock:
+            row = _get_stock_cache_conn().execute(
+                "SELECT payload FROM stock_cache WHERE ticker = ? AND cache_date = ?",
+                (ticker, cache_date)
+            ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Warning: Could not read stock cache: {e}")
+        return None
+    return orjson.loads(row[0]) if row else None
+
+def _stock_cache_put(ticker: str, cache_date: str, stock_data: Dict):
+    try:
+        payload = orjson.dumps(stock_data).decode()
+        with _stock_cache_lock:
+            conn = _get_stock_cache_conn()
+            # Older days for this ticker are never read again
+            conn.execute(
+                "DELETE FROM stock_cache WHERE ticker = ? AND cache_date < ?",
+                (ticker, cache_date)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO stock_cache (ticker, cache_date, payload) VALUES (?, ?, ?)",
+                (ticker, cache_date, payload)
+            )
+    except (sqlite3.Error, OSError, orjson.JSONEncodeError) as e:
+        print(f"Warning: Could not write stock cache: {e}")
+
+
 def fetch_stock_data(ticker: str) -> Optional[Dict]:
     """
-    Fetches stock data with timeout handling.
+    Fetches stock data with timeout handling. Results are cached for the
+    rest of the day.
     """
+    cache_date = date.today().isoformat()
+    cached = _stock_cache_get(ticker, cache_date)
+    if cached is not None:
+        return cached
+    
     try:
         fundamentals, summary = get_fundamentals(ticker)
         if not fundamentals:
@@ -117,7 +235,7 @@ def fetch_stock_data(ticker: str) -> Optional[Dict]:
             'ticker': ticker,
             'fundamentals': fundamentals,
             'summary': summary,
-            'sector': 'Unknown',  # Simplified for production
+            'sector': STOCK_SECTORS.get(ticker, 'Unknown'),
             'industry': 'Unknown',
             'volatility': 0.2,  # Default value
             'current_price': fundamentals.get('Current Price', 'N/A'),
@@ -126,6 +244,7 @@ def fetch_stock_data(ticker: str) -> Optional[Dict]:
             'pe_ratio': fundamentals.get('P/E Ratio (Trailing)', 'N/A'),
         }
         
+        _stock_cache_put(ticker, cache_date, stock_data)
         return stock_data
         
     except Exception as e:
@@ -133,31 +252,52 @@ def fetch_stock_data(ticker: str) -> Optional[Dict]:
         return None
 
 
-def calculate_stock_score(
-    stock_data: Dict,
+def fetch_all_stock_data(tickers: List[str]) -> List[Optional[Dict]]:
+    """
+    Fetches stock data for all tickers concurrently. Results are returned in
+    the order of tickers; a ticker that fails or is unfinished once
+    FETCH_TIMEOUT has elapsed for the whole batch yields None.
+    """
+    if not tickers:
+        return []
+    # The sector prefilter often leaves only a handful of tickers
+    executor = ThreadPoolExecutor(max_workers=min(RECOMMENDER_WORKERS, len(tickers)))
+    try:
+        futures = [executor.submit(fetch_stock_data, ticker) for ticker in tickers]
+        # One deadline for the batch, not FETCH_TIMEOUT per ticker in turn
+        done, _ = wait(futures, timeout=FETCH_TIMEOUT)
+        results = []
+        for ticker, future in zip(tickers, futures):
+            if future in done:
+                results.append(future.result())
+            else:
+                print(f"Timed out fetching data for {ticker}")
+                results.append(None)
+        return results
+    finally:
+        # Don't wait on a stuck request; the thread finishes on its own
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def score_stocks(
+    stocks: List[Dict],
     user_profile: Dict,
     trading_history_parsed: Dict
-) -> float:
+) -> np.ndarray:
     """
-    Simplified scoring for production.
+    Simplified scoring for production. Scores all candidates at once and
+    returns an array aligned with stocks.
     """
-    if not stock_data:
-        return 0.0
-    
-    score = 0.5  # Base score
+    scores = np.full(len(stocks), 0.5)  # Base score
     
     # Simple sector matching
     if trading_history_parsed.get('sectors'):
-        score += 0.2
+        scores += SECTOR_MATCH_BONUS
     
-    # Risk tolerance matching (simplified)
-    risk_tolerance = user_profile.get('riskTolerance', 'Medium')
-    if risk_tolerance == 'Low':
-        score += 0.1
-    elif risk_tolerance == 'High':
-        score += 0.3
+    # Risk tolerance matching (simplified), one table lookup per request
+    scores += RISK_TOLERANCE_BONUS.get(user_profile.get('riskTolerance', 'Medium'), 0.0)
     
-    return min(1.0, score)
+    return np.minimum(scores, 1.0)
 
 
 def recommend_stocks(
@@ -186,24 +326,23 @@ def recommend_stocks(
     
     # Get candidate stocks (smaller set)
     candidate_stocks = get_stock_universe(candidate_count=30)
+    candidate_stocks = prefilter_candidates(
+        candidate_stocks, trading_history_parsed['sectors'], num_recommendations
+    )
     print(f"Processing {len(candidate_stocks)} candidate stocks...")
     
-    scored_stocks = []
+    stocks = [s for s in fetch_all_stock_data(candidate_stocks) if s]
+    scores = score_stocks(stocks, user_profile, trading_history_parsed)
     
-    for i, ticker in enumerate(candidate_stocks):
-        stock_data = fetch_stock_data(ticker)
-        if not stock_data:
-            continue
-        
-        score = calculate_stock_score(stock_data, user_profile, trading_history_parsed)
-        
-        # Simple reason generation
-        reason = "Good match with your investment profile"
-        if trading_history_parsed.get('sectors'):
-            reason = f"Matches your interest in {trading_history_parsed['sectors'][0]} sector"
-        
+    # Simple reason generation
+    reason = "Good match with your investment profile"
+    if trading_history_parsed.get('sectors'):
+        reason = f"Matches your interest in {trading_history_parsed['sectors'][0]} sector"
+    
+    scored_stocks = []
+    for stock_data, score in zip(stocks, scores.tolist()):
         scored_stocks.append({
-            'ticker': ticker,
+            'ticker': stock_data['ticker'],
             'score': score,
             'sector': stock_data.get('sector', 'Unknown'),
             'reason': reason,
@@ -211,9 +350,8 @@ def recommend_stocks(
             'pe_ratio': stock_data.get('pe_ratio'),
         })
     
-    # Sort by score and return top N
-    scored_stocks.sort(key=lambda x: x['score'], reverse=True)
-    top_recommendations = scored_stocks[:num_recommendations]
+    # Top N by score (ties keep candidate order, like a stable sort)
+    top_recommendations = heapq.nlargest(num_recommendations, scored_stocks, key=lambda x: x['score'])
     
     print(f"Recommendation complete. Selected {len(top_recommendations)} stocks.")
     
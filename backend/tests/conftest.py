@@ -0,0 +1,36 @@
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+# The backend modules import each other as top-level modules (see api_server.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_server
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Points the connection pool at a fresh SQLite file (and an empty LRU) for one test."""
+    api_server.close_db()
+    monkeypatch.setattr(api_server, "DB_NAME", str(tmp_path / "test_cache.db"))
+    monkeypatch.setattr(api_server, "_memory_cache", OrderedDict())
+    api_server.init_db()
+    yield
+    api_server.close_db()
+
+
+@pytest.fixture
+def make_request():
+    def _make(**overrides):
+        fields = {
+            "ticker": "AAPL",
+            "financialCondition": ["Stable income"],
+            "expectedReturn": 10,
+            "riskTolerance": "Medium",
+            "tradingPreferences": "Long-term tech holdings",
+        }
+        fields.update(overrides)
+        return api_server.AnalysisRequest(**fields)
+    return _make
@@ -0,0 +1,292 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import pytest
+
+import api_server
+
+
+# --- make_cache_key ---
+
+def test_cache_key_ignores_ticker_case(make_request):
+    assert api_server.make_cache_key(make_request(ticker="aapl")) == \
+        api_server.make_cache_key(make_request(ticker="AAPL"))
+
+
+@pytest.mark.parametrize("field, value", [
+    ("riskTolerance", "High"),
+    ("expectedReturn", 50),
+    ("financialCondition", ["Student loans"]),
+    ("tradingPreferences", "Day trading small caps"),
+])
+def test_cache_key_covers_profile(make_request, field, value):
+    assert api_server.make_cache_key(make_request(**{field: value})) != \
+        api_server.make_cache_key(make_request())
+
+
+# --- In-memory LRU ---
+
+@pytest.fixture
+def small_memory_cache(monkeypatch):
+    monkeypatch.setattr(api_server, "_memory_cache", OrderedDict())
+    monkeypatch.setattr(api_server, "MEMORY_CACHE_SIZE", 2)
+
+
+def test_memory_cache_evicts_least_recently_used(small_memory_cache):
+    now = time.time()
+    api_server._memory_cache_put("a", "A", now)
+    api_server._memory_cache_put("b", "B", now)
+    assert api_server._memory_cache_get("a") == "A"
+
+    api_server._memory_cache_put("c", "C", now)
+
+    assert api_server._memory_cache_get("b") is None
+    assert api_server._memory_cache_get("a") == "A"
+    assert api_server._memory_cache_get("c") == "C"
+
+
+def test_memory_cache_drops_stale_entries(small_memory_cache):
+    api_server._memory_cache_put("old", "stale", time.time() - api_server.CACHE_DURATION)
+
+    assert api_server._memory_cache_get("old") is None
+    assert "old" not in api_server._memory_cache
+
+
+def test_sqlite_hit_fills_memory_cache(db):
+    api_server._set_cached_analyses_sync([("AAPL:key", "cached", time.time())])
+
+    assert asyncio.run(api_server.get_cached_analysis("AAPL:key")) == "cached"
+    assert api_server._memory_cache_get("AAPL:key") == "cached"
+
+
+# --- _claim_pending_jobs_sync ---
+
+def _insert_job(job_id, status, attempts, request_json='{"ticker": "AAPL"}'):
+    with api_server.get_conn() as conn:
+        conn.execute(api_server._SQL_INSERT_JOB, (job_id, status, None, 0.0, request_json, attempts))
+
+
+def _job_row(job_id):
+    with api_server.get_conn() as conn:
+        return conn.execute("SELECT status, attempts FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+
+def test_claim_pending_jobs_bumps_attempts(db):
+    _insert_job("pending-job", "pending", 1)
+    _insert_job("done-job", "complete", 1)
+
+    claimed = api_server._claim_pending_jobs_sync()
+
+    assert [job_id for job_id, _ in claimed] == ["pending-job"]
+    assert _job_row("pending-job") == ("pending", 2)
+    assert _job_row("done-job") == ("complete", 1)
+
+
+def test_claim_pending_jobs_fails_after_max_attempts(db):
+    _insert_job("stuck-job", "pending", api_server.MAX_JOB_ATTEMPTS)
+
+    assert api_server._claim_pending_jobs_sync() == []
+    assert _job_row("stuck-job") == ("failed", api_server.MAX_JOB_ATTEMPTS)
+
+
+def test_claim_pending_jobs_skips_jobs_without_request(db):
+    _insert_job("legacy-job", "pending", 0, request_json=None)
+
+    assert api_server._claim_pending_jobs_sync() == []
+
+
+# --- wait_for_job ---
+
+def test_cancelled_waiter_leaves_no_event_behind(db):
+    _insert_job("running-job", "pending", 0)
+
+    async def scenario():
+        leaving = asyncio.create_task(api_server.wait_for_job("running-job"))
+        staying = asyncio.create_task(api_server.wait_for_job("running-job"))
+        while api_server._job_waiters.get("running-job") != 2:
+            await asyncio.sleep(0.01)
+        leaving.cancel()
+        await asyncio.gather(leaving, return_exceptions=True)
+        assert "running-job" in api_server._job_events
+
+        await api_server.update_job_complete("running-job", "result")
+        return await asyncio.wait_for(staying, 1)
+
+    assert asyncio.run(scenario()) == {"status": "complete", "result": "result"}
+    assert api_server._job_events == {}
+    assert api_server._job_waiters == {}
+
+
+# --- submit_analysis_job ---
+
+@pytest.fixture
+def blocked_analysis(monkeypatch):
+    """Replaces the analysis task with one that waits until released."""
+    release = asyncio.Event()
+    started = []
+
+    async def fake_task(job_id, request, semantic_checked=False):
+        started.append(job_id)
+        await release.wait()
+
+    monkeypatch.setattr(api_server, "run_full_analysis_task", fake_task)
+    return release, started
+
+
+def test_submit_joins_identical_inflight_job(db, make_request, blocked_analysis):
+    release, started = blocked_analysis
+
+    async def scenario():
+        first = await api_server.submit_analysis_job(make_request())
+        second = await api_server.submit_analysis_job(make_request(ticker="aapl"))
+        other = await api_server.submit_analysis_job(make_request(riskTolerance="High"))
+        release.set()
+        await asyncio.gather(*api_server._running_jobs)
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+
+    assert first == second
+    assert other != first
+    assert started == [first, other]
+    assert api_server._inflight_jobs == {}
+
+
+def test_submit_releases_claim_when_create_job_fails(db, make_request, blocked_analysis, monkeypatch):
+    release, started = blocked_analysis
+    real_create_job = api_server.create_job
+
+    async def failing_create_job(job_id, request):
+        raise ConnectionError("backend unavailable")
+
+    async def scenario():
+        monkeypatch.setattr(api_server, "create_job", failing_create_job)
+        with pytest.raises(ConnectionError):
+            await api_server.submit_analysis_job(make_request())
+        assert api_server._inflight_jobs == {}
+
+        monkeypatch.setattr(api_server, "create_job", real_create_job)
+        job_id = await api_server.submit_analysis_job(make_request())
+        release.set()
+        await asyncio.gather(*api_server._running_jobs)
+        return job_id
+
+    job_id = asyncio.run(scenario())
+
+    assert started == [job_id]
+    assert api_server._inflight_jobs == {}
+
+
+# --- stream_analysis_events ---
+
+@pytest.fixture
+def counted_analysis(monkeypatch):
+    """Replaces the AI pipeline with one that records calls and waits until released."""
+    release = asyncio.Event()
+    calls = []
+
+    async def fake_run_ai_analysis(ticker, request, log_prefix, token_stream=None):
+        calls.append(ticker)
+        if token_stream is not None:
+            token_stream.publish("Apple ")
+        await release.wait()
+        return '{"analysis": "done"}', [], False
+
+    monkeypatch.setattr(api_server, "run_ai_analysis", fake_run_ai_analysis)
+    monkeypatch.setattr(api_server, "get_recommendations", lambda request: [])
+    return release, calls
+
+
+def test_concurrent_identical_streams_share_one_analysis(semantic_cache, make_request, counted_analysis):
+    release, calls = counted_analysis
+
+    async def collect():
+        return [event async for event in api_server.stream_analysis_events(make_request())]
+
+    async def scenario():
+        streams = [asyncio.create_task(collect()) for _ in range(2)]
+        while not api_server._job_streams or \
+                len(next(iter(api_server._job_streams.values())).subscribers) < 2:
+            await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*streams)
+
+    first, second = asyncio.run(scenario())
+
+    assert calls == ["AAPL"]
+    assert first == second
+    assert first[0] == api_server._sse({"type": "token", "text": "Apple "})
+    assert '"complete"' in first[-1]
+    assert api_server._inflight_jobs == {}
+
+
+# --- Semantic cache ---
+
+@pytest.fixture
+def semantic_cache(db, monkeypatch):
+    """Empty semantic cache whose embeddings depend only on the preference text."""
+    import numpy as np
+
+    async def fake_submit(text):
+        vector = np.zeros((1, 8), dtype="float32")
+        vector[0, len(text) % 8] = 1.0
+        vector[0, 0] += 1.0
+        return vector
+
+    monkeypatch.setattr(api_server, "_semantic_indices", {})
+    monkeypatch.setattr(api_server.embedding_batcher, "submit", fake_submit)
+
+
+def _put_then_get(stored, looked_up):
+    async def scenario():
+        await api_server.semantic_cache_put(stored, '{"analysis": "cached"}', api_server.time.time())
+        return await api_server.semantic_cache_get(looked_up)
+    return asyncio.run(scenario())
+
+
+def test_semantic_cache_hits_same_profile(semantic_cache, make_request):
+    assert _put_then_get(make_request(), make_request()) == '{"analysis": "cached"}'
+
+
+@pytest.mark.parametrize("field, value", [
+    ("riskTolerance", "High"),
+    ("expectedReturn", 50),
+    ("financialCondition", ["Student loans"]),
+    ("ticker", "MSFT"),
+])
+def test_semantic_cache_misses_other_structured_profile(semantic_cache, make_request, field, value):
+    stored = make_request(riskTolerance="Low")
+    looked_up = make_request(**{"riskTolerance": "Low", field: value})
+    # Identical trading preferences, so the embeddings match exactly
+    assert _put_then_get(stored, looked_up) is None
+
+
+def test_job_skips_semantic_lookup_the_caller_already_did(db, make_request, counted_analysis, monkeypatch):
+    release, calls = counted_analysis
+    release.set()
+    lookups = []
+
+    async def fake_get_cached_analysis(cache_key, request=None):
+        lookups.append(request)
+        return None
+
+    monkeypatch.setattr(api_server, "get_cached_analysis", fake_get_cached_analysis)
+
+    async def scenario():
+        await api_server.submit_analysis_job(make_request(), semantic_checked=True)
+        await asyncio.gather(*api_server._running_jobs)
+
+    asyncio.run(scenario())
+
+    assert lookups == [None]
+    assert calls == ["AAPL"]
+
+
+def test_semantic_cache_reloads_from_sqlite(semantic_cache, make_request):
+    _put_then_get(make_request(), make_request())
+    api_server._semantic_indices.clear()
+
+    api_server.load_semantic_cache()
+
+    assert asyncio.run(api_server.semantic_cache_get(make_request())) == '{"analysis": "cached"}'
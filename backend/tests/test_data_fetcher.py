@@ -0,0 +1,86 @@
+import asyncio
+
+import faiss
+import httpx
+import numpy as np
+import pytest
+
+import data_fetcher
+
+
+def _client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture
+def news_client(monkeypatch):
+    """Routes get_news() through a mock transport instead of NewsAPI."""
+    def _install(handler):
+        client = _client(handler)
+        monkeypatch.setattr(data_fetcher, "http_client", client)
+        return client
+    return _install
+
+
+def test_get_news_keeps_first_copy_of_each_url(news_client):
+    articles = [
+        {"source": {"name": "Wire"}, "publishedAt": "2024-01-01", "url": "https://a", "description": "first"},
+        {"source": {"name": "Mirror"}, "publishedAt": "2024-01-01", "url": "https://a", "description": "copy"},
+        {"source": None, "url": "https://b", "content": "second"},
+    ]
+    news_client(lambda request: httpx.Response(200, json={"status": "ok", "articles": articles}))
+
+    result = asyncio.run(data_fetcher.get_news("AAPL", "key"))
+
+    assert [a["text"] for a in result] == ["first", "second"]
+    assert result[1]["source"] == "Unknown"
+
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(200, content=b"<html>Service Unavailable</html>"),
+    httpx.Response(200, content=b'{"status": "ok", "articles": ['),
+    httpx.Response(401, json={"status": "error", "message": "bad key"}),
+])
+def test_get_news_returns_empty_on_bad_response(news_client, response):
+    news_client(lambda request: response)
+
+    assert asyncio.run(data_fetcher.get_news("AAPL", "key")) == []
+
+
+def test_get_news_without_key_skips_request(news_client):
+    def fail(request):
+        raise AssertionError("NewsAPI should not be called")
+    news_client(fail)
+
+    assert asyncio.run(data_fetcher.get_news("AAPL", "")) == []
+
+
+# --- build_vector_index ---
+
+def _unit_vectors(num_vectors, dimension=8):
+    vectors = np.random.default_rng(0).standard_normal((num_vectors, dimension)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("num_vectors, index_type", [
+    (100, faiss.IndexFlatIP),
+    (data_fetcher.HNSW_MIN_VECTORS, faiss.IndexHNSWFlat),
+    (data_fetcher.IVF_PQ_MIN_VECTORS, faiss.IndexIVFPQ),
+])
+def test_index_type_follows_corpus_size(num_vectors, index_type):
+    index = data_fetcher.build_vector_index(_unit_vectors(num_vectors))
+
+    assert isinstance(faiss.downcast_index(index), index_type)
+    assert index.ntotal == num_vectors
+    assert index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+@pytest.mark.parametrize("num_vectors", [100, data_fetcher.HNSW_MIN_VECTORS])
+def test_index_finds_stored_vector(num_vectors):
+    vectors = _unit_vectors(num_vectors)
+    index = data_fetcher.build_vector_index(vectors)
+
+    scores, ids = index.search(vectors[:1], 1)
+
+    assert ids[0, 0] == 0
+    assert scores[0, 0] == pytest.approx(1.0, abs=1e-5)
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+import stock_recommender
+
+
+# --- parse_trading_history: tickers ---
+
+def test_parse_tickers_in_first_mention_order():
+    parsed = stock_recommender.parse_trading_history("Bought AAPL and msft, then TSLA; sold AAPL again")
+
+    assert parsed['tickers'] == ['AAPL', 'MSFT', 'TSLA']
+
+
+def test_parse_ignores_short_words_outside_the_universe():
+    # Short upper-case words used to be admitted as tickers
+    assert stock_recommender.parse_trading_history("I AM A BIG FAN OF THE MARKET")['tickers'] == []
+
+
+# --- parse_trading_history: sectors and preferences ---
+
+def test_parse_finds_sectors_in_keyword_order():
+    parsed = stock_recommender.parse_trading_history("Mostly oil majors, some banking and software names")
+
+    assert parsed['sectors'] == ['Technology', 'Finance', 'Energy']
+
+
+def test_parse_matches_keywords_at_word_start_only():
+    # 'ai' must not match inside 'retail'
+    assert stock_recommender.parse_trading_history("I buy retail chains")['sectors'] == ['Consumer']
+
+
+@pytest.mark.parametrize("text, preferences", [
+    ("Long-term dividend income", {'type': 'dividend', 'holding_period': 'long'}),
+    ("Value stocks but also growth, some day trading", {'type': 'growth', 'holding_period': 'short'}),
+    ("Nothing specific", {}),
+])
+def test_parse_preferences(text, preferences):
+    assert stock_recommender.parse_trading_history(text)['preferences'] == preferences
+
+
+@pytest.mark.parametrize("history", ["", None, 42])
+def test_parse_empty_history(history):
+    assert stock_recommender.parse_trading_history(history) == {'tickers': [], 'sectors': [], 'preferences': {}}
+
+
+# --- prefilter_candidates ---
+
+def test_prefilter_without_sectors_keeps_candidates():
+    candidates = ['AAPL', 'JPM', 'XOM']
+
+    assert stock_recommender.prefilter_candidates(candidates, [], 5) == candidates
+
+
+def test_prefilter_tops_up_a_small_sector():
+    candidates = stock_recommender.get_stock_universe(30)
+
+    result = stock_recommender.prefilter_candidates(candidates, ['Energy'], 5)
+
+    assert result == ['XOM', 'CVX'] + candidates[:3]
+
+
+def test_prefilter_takes_whole_sector_from_the_universe():
+    candidates = ['AAPL', 'JPM']
+
+    result = stock_recommender.prefilter_candidates(candidates, ['Healthcare'], 5)
+
+    assert result == stock_recommender.STOCKS_BY_SECTOR['Healthcare']
+
+
+@pytest.fixture
+def fake_fetch(monkeypatch):
+    """Records the tickers fetched and returns minimal stock data for them."""
+    fetched = []
+
+    def fetch_all(tickers):
+        fetched.extend(tickers)
+        return [{'ticker': t, 'sector': stock_recommender.STOCK_SECTORS[t]} for t in tickers]
+
+    monkeypatch.setattr(stock_recommender, "fetch_all_stock_data", fetch_all)
+    return fetched
+
+
+def test_recommend_fetches_only_prefiltered_candidates(fake_fetch):
+    stock_recommender.recommend_stocks("I like oil and gas", [], 10, "Medium", num_recommendations=2)
+
+    assert fake_fetch == ['XOM', 'CVX']
+
+
+# --- score_stocks ---
+
+@pytest.mark.parametrize("risk, sectors, expected", [
+    ("Medium", [], 0.5),
+    ("Low", [], 0.6),
+    ("Low", ["Energy"], 0.8),
+    ("High", ["Energy"], 1.0),  # 1.0 after the cap
+    ("Unknown", [], 0.5),
+])
+def test_score_stocks(risk, sectors, expected):
+    stocks = [{'ticker': 'XOM'}, {'ticker': 'CVX'}]
+
+    scores = stock_recommender.score_stocks(stocks, {'riskTolerance': risk}, {'sectors': sectors})
+
+    np.testing.assert_allclose(scores, [expected, expected])
+
+
+def test_score_stocks_without_candidates():
+    assert stock_recommender.score_stocks([], {'riskTolerance': 'High'}, {'sectors': []}).shape == (0,)
+
+
+def test_recommend_keeps_candidate_order_on_equal_scores(fake_fetch):
+    result = stock_recommender.recommend_stocks("I like oil and gas", [], 10, "High", num_recommendations=5)
+
+    assert [r['ticker'] for r in result] == ['XOM', 'CVX', 'AAPL', 'MSFT', 'GOOGL']
+    assert all(r['score'] == 1.0 for r in result)
+    assert result[0]['reason'] == "Matches your interest in Energy sector"